@@ -0,0 +1,220 @@
+# api_server.py
+# Service d'inférence HTTP sans interface (ASGI), partageant le chargeur du modèle
+#
+# Lancement :
+#   python api_server.py --workers 4 --port 8000
+#   curl --data-binary @photo.jpg "http://localhost:8000/detect?conf=0.25"
+#   curl --data-binary @photo.jpg "http://localhost:8000/detect?model=best_v2"
+#   curl --data-binary @photo.jpg "http://localhost:8000/detect?camera=parking-nord"
+#   curl "http://localhost:8000/history/classes?hours=24"   # avec DETECTION_HISTORY_DB
+import argparse
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from history import HOUR, store_from_env
+from inference import DEFAULT_CONF, DEFAULT_IMGSZ, DEFAULT_MAX_DECODE_MB, MODEL_PATH, decode_reduced
+from metrics import METRICS
+from model_info import model_metadata
+from model_registry import registry_from_env
+from result_cache import DetectionCache, entry_from_result, hash_bytes, make_key, scale_entry
+from startup import preload
+
+# Le chemin du modèle peut être surchargé pour chaque déploiement
+API_MODEL_PATH = os.environ.get("MODEL_PATH", MODEL_PATH)
+# Pixels décodés au plus par requête (PNG et autres formats décodés en pleine résolution)
+MAX_DECODE_BYTES = int(float(os.environ.get("MAX_DECODE_MB", DEFAULT_MAX_DECODE_MB)) * 1024 * 1024)
+# Résolution d'inférence maximale acceptée par /detect
+MAX_IMGSZ = 2048
+
+# ---------------------------------------
+# 🧠 MODÈLES (UN REGISTRE PAR PROCESSUS WORKER)
+# ---------------------------------------
+_registry = registry_from_env(
+    models_dir=os.path.dirname(API_MODEL_PATH) or ".",
+    default_version=os.path.splitext(os.path.basename(API_MODEL_PATH))[0],
+)
+_cache = DetectionCache(max_entries=int(os.environ.get("DETECTION_CACHE_SIZE", "256")))
+# Historique partagé par les workers (SQLite WAL); None si DETECTION_HISTORY_DB n'est pas défini
+_history = store_from_env()
+
+
+def get_handle(version=None):
+    """Modèle résident de la version demandée (la version par défaut pendant un chargement)"""
+    if version and version not in _registry.versions():
+        raise HTTPException(status_code=404, detail=f"Version de modèle inconnue : {version}")
+    handle = _registry.get(version)
+    if handle is None:
+        raise HTTPException(status_code=503, detail=f"Modèle indisponible : {_registry.status()['errors']}")
+    return handle
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Modèle chargé et préchauffé avant d'accepter la première requête
+    await run_in_threadpool(preload, _registry)
+    _registry.start()
+    yield
+    _registry.stop()
+    if _history is not None:
+        _history.close()
+
+
+app = FastAPI(title="Détection Intelligente de Poubelles", lifespan=lifespan)
+
+
+# ---------------------------------------
+# 🌐 ROUTES
+# ---------------------------------------
+@app.get("/health")
+async def health():
+    status = _registry.status()
+    return {
+        "status": "ok" if status["resident"] else "loading",
+        "models": status,
+        "pid": os.getpid(),
+    }
+
+
+@app.get("/models")
+async def models():
+    """Versions disponibles dans le dossier des modèles et état du registre"""
+    return {"versions": list(_registry.versions()), **_registry.status()}
+
+
+@app.get("/stats")
+async def stats(model: str = None):
+    handle = get_handle(model)
+    return {"pid": os.getpid(), "model": handle.version, "scheduler": handle.scheduler.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Durées par étape et compteurs au format Prometheus (par processus worker)"""
+    return METRICS.render_prometheus()
+
+
+@app.get("/model/info")
+async def model_info(model: str = None):
+    """Métadonnées du checkpoint (taille, empreinte, date, classes)"""
+    handle = get_handle(model)
+    return {"version": handle.version, **model_metadata(handle.path, handle.model.names)}
+
+
+@app.get("/model")
+async def download_model(model: str = None):
+    """Téléchargement du checkpoint en flux, sans le charger en mémoire"""
+    handle = get_handle(model)
+    meta = model_metadata(handle.path, handle.model.names)
+    return FileResponse(
+        handle.path,
+        media_type="application/octet-stream",
+        filename=os.path.basename(handle.path),
+        headers={"ETag": f'"{meta["sha256"]}"'},
+    )
+
+
+@app.post("/detect")
+async def detect(request: Request, response: Response, conf: float = Query(DEFAULT_CONF, ge=0, le=1),
+                 imgsz: int = Query(DEFAULT_IMGSZ, gt=0, le=MAX_IMGSZ), model: str = None, camera: str = None):
+    """Reçoit les octets bruts d'une image et renvoie les détections en JSON.
+
+    `model` choisit une version (nom du fichier .pt sans extension); si elle
+    n'est pas encore chargée, la version par défaut répond en attendant.
+    `camera` rattache l'analyse à une caméra dans l'historique.
+    """
+    data = await request.body()
+    if not data:
+        raise HTTPException(status_code=400, detail="Corps de requête vide")
+
+    handle = get_handle(model)
+    response.headers["X-Model-Version"] = handle.version
+    METRICS.inc("analyses")
+    image_hash = hash_bytes(data)
+    key = make_key(image_hash, handle.fingerprint, conf, imgsz)
+    entry = _cache.get(key)
+    cached = entry is not None
+    METRICS.inc("cache_hits" if cached else "cache_misses")
+
+    if entry is None:
+        try:
+            # Décodage directement à la résolution d'inférence; boîtes ramenées à l'original
+            with METRICS.stage("decode"):
+                image, scale = await run_in_threadpool(decode_reduced, data, imgsz, MAX_DECODE_BYTES)
+        except MemoryError as e:
+            METRICS.inc("errors")
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            METRICS.inc("errors")
+            raise HTTPException(status_code=400, detail=f"Image illisible : {e}")
+        with METRICS.stage("predict"):
+            # submit() prédit en direct si l'ordonnanceur vient d'être arrêté (rechargement,
+            # éviction) : appelé hors de la boucle d'événements pour ne jamais la bloquer
+            future = await run_in_threadpool(handle.scheduler.submit, image, conf, imgsz)
+            result = await asyncio.wrap_future(future)
+        entry = scale_entry(entry_from_result(result), scale)
+        _cache.put(key, entry)
+    METRICS.inc("detections", len(entry["classes"]))
+    if _history is not None:
+        _history.record(image_hash, entry, camera, handle.model.names)
+
+    return {
+        "cached": cached,
+        "model": handle.version,
+        "detections": [
+            {"box": box, "class_id": cls_idx, "class_name": handle.model.names[cls_idx], "confidence": score}
+            for box, cls_idx, score in zip(entry["boxes"], entry["classes"], entry["scores"])
+        ],
+    }
+
+
+# ---------------------------------------
+# 🗄️ HISTORIQUE (AGRÉGATS HORAIRES)
+# ---------------------------------------
+# Routes synchrones : FastAPI les exécute dans son pool de threads, les agrégats
+# SQLite ne bloquent donc pas la boucle d'événements (et /detect)
+def get_history():
+    if _history is None:
+        raise HTTPException(status_code=404, detail="Historique désactivé (DETECTION_HISTORY_DB)")
+    return _history
+
+
+@app.get("/history/classes")
+def history_classes(hours: int = 24, camera: str = None):
+    """Détections par classe sur les `hours` dernières heures"""
+    return get_history().class_counts(since=time.time() - hours * HOUR, camera=camera)
+
+
+@app.get("/history/cameras")
+def history_cameras(hours: int = 24):
+    return get_history().camera_counts(since=time.time() - hours * HOUR)
+
+
+@app.get("/history/hourly")
+def history_hourly(hours: int = 24, camera: str = None, cls: int = None):
+    """Détections par heure, éventuellement pour une caméra et une classe"""
+    return get_history().hourly_counts(since=time.time() - hours * HOUR, camera=camera, cls=cls)
+
+
+# ---------------------------------------
+# 🚀 POINT D'ENTRÉE
+# ---------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Serveur d'inférence YOLO headless")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("API_WORKERS", "1")),
+                        help="Nombre de processus workers (un registre de modèles par processus)")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
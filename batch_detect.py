@@ -0,0 +1,327 @@
+# batch_detect.py
+# Détection en masse sur un dossier ou une archive (zip/tar), en flux, avec reprise
+#
+# Usage :
+#   python batch_detect.py /archives/photos_2024 -o detections.jsonl
+#   python batch_detect.py photos.tar.gz -o detections.jsonl --batch 16
+#   python batch_detect.py photos.zip -o detections_parquet --format parquet
+#
+# Relancer la même commande après un arrêt reprend là où le travail s'était arrêté :
+# les images déjà présentes dans la sortie sont ignorées.
+import argparse
+import glob
+import json
+import os
+import tarfile
+import time
+import zipfile
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from inference import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CONF, DEFAULT_IMGSZ, DEFAULT_MAX_DECODE_MB, MODEL_PATH, decode_reduced,
+    image_size, load_yolo, predict_batched,
+)
+from result_cache import entry_from_result, scale_entry
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+PARQUET_ROWS_PER_PART = 5000
+# Au plus ce délai entre deux fichiers part : borne le travail perdu par un arrêt brutal
+PARQUET_FLUSH_S = 60.0
+
+
+# ---------------------------------------
+# 📂 SOURCES (GÉNÉRATEURS)
+# ---------------------------------------
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_directory(root):
+    """(identifiant, lecteur d'octets) pour chaque image d'un dossier, en ordre stable"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if _is_image(name):
+                path = os.path.join(dirpath, name)
+                yield os.path.relpath(path, root), (lambda p=path: _read_file(p))
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def iter_zip(path):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and _is_image(info.filename):
+                yield info.filename, archive.read(info)
+
+
+def iter_tar(path):
+    # Mode flux "r|*" : l'archive est lue séquentiellement, sans index ni retour arrière
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and _is_image(member.name):
+                yield member.name, archive.extractfile(member).read()
+
+
+def iter_source(source):
+    """Générateur (identifiant, octets ou lecteur) selon le type de source"""
+    if os.path.isdir(source):
+        return iter_directory(source)
+    if zipfile.is_zipfile(source):
+        return iter_zip(source)
+    if tarfile.is_tarfile(source):
+        return iter_tar(source)
+    raise ValueError(f"Source non reconnue (dossier, .zip ou .tar attendu) : {source}")
+
+
+# ---------------------------------------
+# ⚙️ PIPELINE : LECTURE → DÉCODAGE → LOTS
+# ---------------------------------------
+# Image décodée en résolution réduite; `scale` ramène ses coordonnées à l'original
+Decoded = namedtuple("Decoded", "item_id image scale width height error")
+
+
+def _load(item, target, max_bytes=None):
+    item_id, payload = item
+    try:
+        data = payload() if callable(payload) else payload
+        width, height = image_size(data)
+        image, scale = decode_reduced(data, target, max_bytes=max_bytes)
+        return Decoded(item_id, image, scale, width, height, None)
+    except Exception as e:
+        return Decoded(item_id, None, 1.0, None, None, str(e))
+
+
+def decoded_stream(items, workers, prefetch, target=DEFAULT_IMGSZ, max_bytes=None):
+    """Décode en parallèle en gardant au plus `prefetch` images en avance, dans l'ordre.
+
+    Les images sont décodées réduites à `target` (voir inference.decode_reduced);
+    celles dont le décodage dépasserait `max_bytes` sont refusées en erreur.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(_load, item, target, max_bytes))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def batched(stream, size):
+    batch = []
+    for element in stream:
+        batch.append(element)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------------------
+# 💾 SORTIES AVEC POINT DE REPRISE
+# ---------------------------------------
+class JsonlWriter:
+    """Sortie JSONL en ajout; la dernière ligne tronquée d'un arrêt brutal est supprimée"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            self._recover()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _recover(self):
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    self.done.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    break
+                valid_size += len(line)
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_size)
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        # Un lot écrit = un point de reprise
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Sortie Parquet découpée en fichiers part-NNNNN.parquet (le format n'admet pas l'ajout).
+
+    Nécessite pyarrow; le point de reprise est le dernier fichier part écrit.
+    Un part est écrit toutes les `rows_per_part` lignes ou toutes les
+    `flush_s` secondes : un arrêt brutal perd au plus ce qui a été traité
+    depuis, au prix de parts plus petits sur les sources lentes.
+    """
+
+    def __init__(self, path, rows_per_part=PARQUET_ROWS_PER_PART, flush_s=PARQUET_FLUSH_S):
+        import pyarrow.parquet as pq
+
+        self._pq = pq
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self.flush_s = flush_s
+        self._flushed_at = time.monotonic()
+        self.done = set()
+        self._buffer = []
+        os.makedirs(path, exist_ok=True)
+        self._parts = sorted(glob.glob(os.path.join(path, "part-*.parquet")))
+        for part in self._parts:
+            self.done.update(pq.read_table(part, columns=["id"]).column("id").to_pylist())
+
+    def write(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.rows_per_part or time.monotonic() - self._flushed_at >= self.flush_s:
+            self._flush()
+
+    def _flush(self):
+        self._flushed_at = time.monotonic()
+        if not self._buffer:
+            return
+        import pyarrow as pa
+
+        rows = [dict(row, detections=json.dumps(row["detections"], ensure_ascii=False)) for row in self._buffer]
+        part = os.path.join(self.path, f"part-{len(self._parts):05d}.parquet")
+        tmp = part + ".tmp"
+        self._pq.write_table(pa.Table.from_pylist(rows), tmp)
+        os.replace(tmp, part)
+        self._parts.append(part)
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+
+
+# ---------------------------------------
+# 🚀 TRAITEMENT
+# ---------------------------------------
+def _detections(entry, names):
+    return [
+        {"box": box, "class_id": cls_idx, "class_name": names[cls_idx], "confidence": score}
+        for box, cls_idx, score in zip(entry["boxes"], entry["classes"], entry["scores"])
+    ]
+
+
+def run(source, output, model, fmt="jsonl", batch_size=DEFAULT_BATCH_SIZE, workers=None,
+        prefetch=None, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ, log_every=1000, pool=None,
+        max_decode_mb=DEFAULT_MAX_DECODE_MB):
+    """Traite `source` lot par lot. Avec `pool` (worker_pool.InferencePool), plusieurs
+    lots sont en vol à la fois, un par réplique, et écrits dans l'ordre; `model`
+    peut alors valoir None (classes fournies par le pool)."""
+    workers = workers or min(8, os.cpu_count() or 1)
+    prefetch = prefetch or batch_size * 4
+    max_bytes = int(max_decode_mb * 1024 * 1024) if max_decode_mb else None
+    names = pool.names if pool is not None else model.names
+    writer = ParquetWriter(output) if fmt == "parquet" else JsonlWriter(output)
+    skipped = len(writer.done)
+    if skipped:
+        print(f"↩️ Reprise : {skipped} images déjà traitées")
+
+    def submit(images):
+        future = Future()
+        if not images:
+            # Lot entièrement illisible : rien à prédire (predict([]) échoue dans ultralytics)
+            future.set_result([])
+            return future
+        if pool is not None:
+            return pool.submit_many(images, conf=conf, imgsz=imgsz)
+        results = predict_batched(model, images, conf=conf, imgsz=imgsz, batch_size=batch_size)
+        future.set_result([entry_from_result(r) for r in results])
+        return future
+
+    todo = ((item_id, payload) for item_id, payload in iter_source(source) if item_id not in writer.done)
+    max_in_flight = pool.replicas * 2 if pool is not None else 1
+    in_flight = deque()
+    processed = errors = 0
+    started = time.perf_counter()
+
+    def drain(limit):
+        nonlocal processed, errors
+        while len(in_flight) > limit:
+            batch, future = in_flight.popleft()
+            entries = iter(future.result())
+            rows = []
+            for item in batch:
+                if item.image is None:
+                    errors += 1
+                    rows.append({"id": item.item_id, "width": None, "height": None, "error": item.error,
+                                 "detections": []})
+                    continue
+                rows.append({
+                    "id": item.item_id,
+                    "width": item.width,
+                    "height": item.height,
+                    "error": None,
+                    "detections": _detections(scale_entry(next(entries), item.scale), names),
+                })
+            writer.write(rows)
+
+            previous, processed = processed, processed + len(batch)
+            if processed // log_every > previous // log_every:
+                rate = processed / (time.perf_counter() - started)
+                print(f"  {processed} images ({rate:.1f} img/s, {errors} erreurs)")
+
+    try:
+        for batch in batched(decoded_stream(todo, workers, prefetch, imgsz, max_bytes), batch_size):
+            in_flight.append((batch, submit([item.image for item in batch if item.image is not None])))
+            drain(max_in_flight - 1)
+        drain(0)
+    finally:
+        writer.close()
+    return {"processed": processed, "skipped": skipped, "errors": errors,
+            "seconds": round(time.perf_counter() - started, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Détection en masse avec sortie reprenable")
+    parser.add_argument("source", help="Dossier, archive .zip ou .tar(.gz)")
+    parser.add_argument("-o", "--output", required=True, help="Fichier .jsonl ou dossier Parquet")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--weights", default=MODEL_PATH)
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Threads de décodage")
+    parser.add_argument("--prefetch", type=int, default=None, help="Images décodées en avance")
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--max-decode-mb", type=float, default=DEFAULT_MAX_DECODE_MB,
+                        help="Pixels décodés au plus par image (0 : sans limite)")
+    parser.add_argument("--replicas", type=int, default=0,
+                        help="Processus d'inférence épinglés sur des cœurs distincts (0 : un seul modèle local)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        raise SystemExit(f"❌ Modèle introuvable : {args.weights}")
+    model = pool = None
+    if args.replicas:
+        # Pas de copie locale du modèle : les répliques ont les cœurs pour elles seules
+        from worker_pool import InferencePool
+        pool = InferencePool(args.weights, replicas=args.replicas, slots=args.replicas * 2 * args.batch)
+        print(f"🏭 {pool.replicas} répliques, cœurs : {pool.core_groups}")
+    else:
+        model = load_yolo(args.weights)
+    try:
+        summary = run(args.source, args.output, model, fmt=args.format, batch_size=args.batch,
+                      workers=args.workers, prefetch=args.prefetch, conf=args.conf, imgsz=args.imgsz,
+                      pool=pool, max_decode_mb=args.max_decode_mb)
+    finally:
+        if pool is not None:
+            pool.close()
+    print(f"✅ {json.dumps(summary)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# benchmark.py
+# Banc d'essai de l'inférence : latence et débit selon imgsz, taille de lot, threads et backend
+#
+# Usage :
+#   python benchmark.py images/ --imgsz 320 480 640 --batch 1 4 8 --threads 1 4
+#   python benchmark.py images/ --baseline runs/benchmark/ref/results.json
+#   python benchmark.py photos/ --decode --imgsz 640 1280   # décodage complet vs réduit
+#
+# Chaque configuration s'exécute dans un processus neuf, épinglé sur `threads` cœurs :
+# les variables de threads sont héritées du parent dès le démarrage (avant tout import,
+# numpy compris) et la mémoire résidente maximale lui est propre.
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+
+from inference import MODEL_PATH, BACKEND_PRIORITY, DEFAULT_CONF, backend_paths
+
+DEFAULT_IMGSZ_SWEEP = (320, 480, 640)
+DEFAULT_BATCH_SWEEP = (1, 4, 8)
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "webp")
+# Lues une seule fois, au chargement des bibliothèques BLAS / OpenMP
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+CSV_FIELDS = (
+    "backend", "imgsz", "batch", "threads", "images",
+    "p50_ms", "p95_ms", "p99_ms", "img_per_s", "peak_rss_mb",
+)
+
+
+def list_images(folder, limit=None):
+    """Images d'un dossier, triées pour des runs reproductibles"""
+    paths = sorted(
+        p for ext in IMAGE_EXTENSIONS
+        for p in glob.glob(os.path.join(folder, "**", f"*.{ext}"), recursive=True)
+    )
+    return paths[:limit] if limit else paths
+
+
+def percentile(values, q):
+    """Percentile par interpolation linéaire (q entre 0 et 100)"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * q / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb():
+    """Mémoire résidente maximale du processus courant, en Mo (None si indisponible)"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux : Ko, macOS : octets
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------
+# ⏱️ MESURE D'UNE CONFIGURATION
+# ---------------------------------------
+def run_config(config):
+    """Exécutée dans un processus dédié (voir `run_isolated`); renvoie une ligne de résultats.
+
+    ONNX Runtime et OpenVINO ignorent les variables OMP et torch.set_num_threads :
+    le processus est donc épinglé sur `threads` cœurs, comme les répliques de
+    worker_pool, pour que l'axe threads limite tous les backends.
+    """
+    from worker_pool import available_cores
+
+    threads = config["threads"]
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, available_cores()[:threads])
+
+    import torch
+    from inference import decode_image, iter_batches, load_yolo
+
+    torch.set_num_threads(threads)
+    images = []
+    for path in config["images"]:
+        with open(path, "rb") as f:
+            images.append(decode_image(f.read()))
+
+    model = load_yolo(config["weights"], backend=config["backend"])
+    kwargs = {"conf": DEFAULT_CONF, "imgsz": config["imgsz"], "verbose": False}
+    batches = list(iter_batches(images, config["batch"]))
+
+    for _ in range(config["warmup"]):
+        model.predict(list(batches[0]), **kwargs)
+
+    latencies = []
+    processed = 0
+    started = time.perf_counter()
+    for _ in range(config["repeat"]):
+        for batch in batches:
+            t0 = time.perf_counter()
+            model.predict(list(batch), **kwargs)
+            latencies.append((time.perf_counter() - t0) * 1000.0 / len(batch))
+            processed += len(batch)
+    elapsed = time.perf_counter() - started
+
+    rss = peak_rss_mb()
+    return {
+        "backend": config["backend"],
+        "imgsz": config["imgsz"],
+        "batch": config["batch"],
+        "threads": threads,
+        "images": processed,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "img_per_s": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+    }
+
+
+def run_isolated(config, ctx=None):
+    """Exécute `run_config` dans un processus neuf dont l'environnement fixe déjà les threads.
+
+    Les variables sont posées chez le parent avant le lancement : l'enfant les
+    hérite au démarrage, avant de réimporter ce module (numpy, PIL) pour
+    désérialiser la tâche.
+    """
+    ctx = ctx or get_context("spawn")
+    saved = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    os.environ.update({var: str(config["threads"]) for var in THREAD_ENV_VARS})
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            return pool.submit(run_config, config).result()
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def run_sweep(weights, images, imgsz_values, batch_values, thread_values, backends,
+              warmup=2, repeat=1):
+    """Exécute chaque combinaison dans un processus neuf, l'une après l'autre"""
+    ctx = get_context("spawn")
+    rows = []
+    for backend, imgsz, batch, threads in product(backends, imgsz_values, batch_values, thread_values):
+        config = {
+            "weights": weights, "images": images, "backend": backend, "imgsz": imgsz,
+            "batch": batch, "threads": threads, "warmup": warmup, "repeat": repeat,
+        }
+        row = run_isolated(config, ctx)
+        print(f"  {backend:>13} imgsz={imgsz:<4} batch={batch:<3} threads={threads:<3}"
+              f" p50={row['p50_ms']:.1f} ms  {row['img_per_s']:.1f} img/s")
+        rows.append(row)
+    return rows
+
+
+# ---------------------------------------
+# 🖼️ DÉCODAGE : PLEINE RÉSOLUTION VS RÉDUIT
+# ---------------------------------------
+def run_decode(config):
+    """Exécutée dans un processus dédié : temps et surcoût mémoire de pointe du décodage"""
+    import numpy as np
+    from PIL import Image
+
+    from inference import decode_reduced
+
+    blobs = []
+    for path in config["images"]:
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+    baseline_rss = peak_rss_mb()
+
+    latencies = []
+    for data in blobs:
+        t0 = time.perf_counter()
+        if config["mode"] == "full":
+            # Chemin historique de l'interface : décodage complet puis copie NumPy
+            array = np.array(Image.open(io.BytesIO(data)).convert("RGB"))
+        else:
+            array, _ = decode_reduced(data, config["target"])
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        del array
+
+    rss = peak_rss_mb()
+    return {
+        "mode": config["mode"],
+        "target": config["target"],
+        "images": len(blobs),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "peak_extra_mb": round(rss - baseline_rss, 1) if rss is not None else None,
+    }
+
+
+def run_decode_comparison(images, targets):
+    ctx = get_context("spawn")
+    rows = []
+    configs = [{"mode": "full", "target": None}] + [{"mode": "reduced", "target": t} for t in targets]
+    for config in configs:
+        config["images"] = images
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            row = pool.submit(run_decode, config).result()
+        print(f"  {row['mode']:>7} target={str(row['target']):<5} p50={row['p50_ms']:.1f} ms"
+              f"  p95={row['p95_ms']:.1f} ms  +{row['peak_extra_mb']} Mo")
+        rows.append(row)
+    return rows
+
+
+# ---------------------------------------
+# 📉 COMPARAISON AVEC UNE RÉFÉRENCE
+# ---------------------------------------
+def find_regressions(rows, baseline_rows, tolerance=0.10):
+    """Configurations dont p50 ou le débit se dégradent de plus de `tolerance`"""
+    def key(row):
+        return (row["backend"], row["imgsz"], row["batch"], row["threads"])
+
+    baseline = {key(row): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        ref = baseline.get(key(row))
+        if ref is None:
+            continue
+        if row["p50_ms"] > ref["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{key(row)}: p50 {ref['p50_ms']} → {row['p50_ms']} ms")
+        if row["img_per_s"] < ref["img_per_s"] * (1 - tolerance):
+            regressions.append(f"{key(row)}: débit {ref['img_per_s']} → {row['img_per_s']} img/s")
+    return regressions
+
+
+def write_report(rows, out_dir, meta):
+    os.makedirs(out_dir, exist_ok=True)
+    json_path = os.path.join(out_dir, "results.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": rows}, f, indent=2)
+    csv_path = os.path.join(out_dir, "results.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return json_path, csv_path
+
+
+# ---------------------------------------
+# 🚀 POINT D'ENTRÉE
+# ---------------------------------------
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Banc d'essai de l'inférence YOLO")
+    parser.add_argument("images", help="Dossier d'images de test")
+    parser.add_argument("--weights", default=MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, nargs="+", default=list(DEFAULT_IMGSZ_SWEEP))
+    parser.add_argument("--batch", type=int, nargs="+", default=list(DEFAULT_BATCH_SWEEP))
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, max(1, cpu_count // 2), cpu_count}))
+    parser.add_argument("--backend", nargs="+", default=None,
+                        help="Backends à mesurer (défaut : tous ceux exportés)")
+    parser.add_argument("--limit", type=int, default=64, help="Nombre max. d'images")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--out", default=os.path.join("runs", "benchmark", time.strftime("%Y%m%d-%H%M%S")))
+    parser.add_argument("--baseline", default=None, help="results.json de référence")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--decode", action="store_true",
+                        help="Compare le décodage pleine résolution au décodage réduit (cibles : --imgsz)")
+    args = parser.parse_args()
+
+    images = list_images(args.images, args.limit)
+    if not images:
+        raise SystemExit(f"❌ Aucune image dans {args.images}")
+
+    if args.decode:
+        print(f"🖼️ Décodage de {len(images)} images")
+        rows = run_decode_comparison(images, args.imgsz)
+        os.makedirs(args.out, exist_ok=True)
+        json_path = os.path.join(args.out, "decode.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"commit": git_revision()}, "results": rows}, f, indent=2)
+        print(f"📄 {json_path}")
+        return
+    paths = backend_paths(args.weights)
+    backends = args.backend or [b for b in BACKEND_PRIORITY if os.path.exists(paths[b])]
+
+    print(f"🏁 {len(images)} images · backends {', '.join(backends)}")
+    rows = run_sweep(args.weights, images, args.imgsz, args.batch, args.threads, backends,
+                     warmup=args.warmup, repeat=args.repeat)
+    meta = {
+        "commit": git_revision(),
+        "weights": args.weights,
+        "cpu_count": cpu_count,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    json_path, csv_path = write_report(rows, args.out, meta)
+    print(f"📄 {json_path}\n📄 {csv_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline_rows = json.load(f)["results"]
+        regressions = find_regressions(rows, baseline_rows, args.tolerance)
+        for line in regressions:
+            print(f"❌ Régression {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ Aucune régression par rapport à la référence")
+
+
+if __name__ == "__main__":
+    main()
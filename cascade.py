@@ -0,0 +1,215 @@
+# cascade.py
+# Inférence en cascade : une passe rapide à basse résolution, affinée à pleine
+# résolution (ou par tuiles sur les seules zones incertaines) quand les scores
+# ne sont pas concluants
+#
+# Réglage des seuils (rappel / latence / taux de sortie anticipée) :
+#   python cascade.py dataset/valid/images --accept 0.5 0.6 0.7 --refine full tiles
+import argparse
+import glob
+import json
+import os
+import time
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+
+from detections import Detections
+from inference import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CONF, DEFAULT_IMGSZ, MODEL_PATH, decode_image, load_yolo, predict_batched,
+)
+from metrics import METRICS
+from tiling import DEFAULT_OVERLAP, DEFAULT_TILE_SIZE, count_matches, load_labels, make_tiles, merge_detections
+
+DEFAULT_LOW_IMGSZ = 320
+# Au-dessus : détection acceptée telle quelle à basse résolution
+DEFAULT_ACCEPT_CONF = 0.6
+# Entre ce seuil et DEFAULT_ACCEPT_CONF : candidat incertain qui déclenche l'affinage
+DEFAULT_CANDIDATE_CONF = 0.1
+REFINE_MODES = ("full", "tiles")
+
+CascadeConfig = namedtuple(
+    "CascadeConfig", "low_imgsz high_imgsz accept_conf candidate_conf refine tile_size overlap",
+    defaults=(DEFAULT_LOW_IMGSZ, DEFAULT_IMGSZ, DEFAULT_ACCEPT_CONF, DEFAULT_CANDIDATE_CONF, "full",
+              DEFAULT_TILE_SIZE, DEFAULT_OVERLAP),
+)
+
+
+def cascade_mode(config):
+    """Variante de pipeline pour la clé de cache (voir result_cache.make_key)"""
+    return "cascade:" + ":".join(str(value) for value in config)
+
+
+def _detections(r):
+    """Détections d'un résultat YOLO ou d'une entrée compacte (pool multi-processus)"""
+    return Detections.from_entry(r) if isinstance(r, dict) else Detections.from_result(r)
+
+
+def uncertain(dets, config):
+    """Masque des détections dans la bande incertaine [candidate_conf, accept_conf)"""
+    return (dets.conf >= config.candidate_conf) & (dets.conf < config.accept_conf)
+
+
+def uncertain_windows(height, width, boxes, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP):
+    """Tuiles de la grille (voir tiling.make_tiles) qui recoupent au moins une des `boxes`"""
+    windows = np.array(make_tiles(height, width, tile_size, overlap))
+    hit = ((windows[:, None, 0] < boxes[None, :, 2]) & (windows[:, None, 2] > boxes[None, :, 0])
+           & (windows[:, None, 1] < boxes[None, :, 3]) & (windows[:, None, 3] > boxes[None, :, 1]))
+    return [tuple(window) for window in windows[hit.any(axis=1)].tolist()]
+
+
+def _entry(dets, conf, stage, **extra):
+    entry = dets.filter(min_conf=conf).to_entry()
+    entry.update(preview=None, cascade=stage, **extra)
+    return entry
+
+
+def cascade_predict_many(predict_many, images, config=CascadeConfig(), conf=DEFAULT_CONF,
+                         batch_size=DEFAULT_BATCH_SIZE):
+    """Détection en cascade d'une liste d'images; renvoie une entrée compacte par image.
+
+    `predict_many(images, conf=, imgsz=, batch_size=)` est par exemple
+    `BatchScheduler.predict_many` ou `InferencePool.map`. Toutes les images
+    passent d'abord à `low_imgsz` ; celles dont aucun score ne tombe dans la
+    bande incertaine sortent aussitôt (scène vide ou objets nets). Les autres
+    sont reprises ensemble à `high_imgsz`, ou, en mode "tiles", seules les
+    tuiles qui recoupent un candidat incertain sont analysées. Chaque entrée
+    porte l'étage final dans `cascade` ("low", "full" ou "tiles").
+    """
+    images = list(images)
+    if not images:
+        return []
+    with METRICS.stage("cascade_low"):
+        low = [_detections(r) for r in predict_many(images, conf=min(conf, config.candidate_conf),
+                                                     imgsz=config.low_imgsz, batch_size=batch_size)]
+
+    entries = [None] * len(images)
+    refine = []
+    for i, dets in enumerate(low):
+        if uncertain(dets, config).any():
+            refine.append(i)
+        else:
+            entries[i] = _entry(dets, conf, "low")
+    METRICS.inc("cascade_images", len(images))
+    METRICS.inc("cascade_early_exit", len(images) - len(refine))
+    if not refine:
+        return entries
+
+    if config.refine == "full":
+        with METRICS.stage("cascade_full"):
+            results = predict_many([images[i] for i in refine], conf=conf, imgsz=config.high_imgsz,
+                                   batch_size=batch_size)
+        for i, r in zip(refine, results):
+            entries[i] = _entry(_detections(r), conf, "full")
+        METRICS.inc("cascade_refined_full", len(refine))
+        return entries
+
+    # Tuiles des zones incertaines de toutes les images, en un seul appel
+    crops, owners = [], []
+    for i in refine:
+        height, width = images[i].shape[:2]
+        boxes = low[i].xyxy[uncertain(low[i], config)]
+        for x0, y0, x1, y1 in uncertain_windows(height, width, boxes, config.tile_size, config.overlap):
+            crops.append(images[i][y0:y1, x0:x1])
+            owners.append((i, x0, y0))
+    with METRICS.stage("cascade_tiles"):
+        results = predict_many(crops, conf=conf, imgsz=config.tile_size, batch_size=batch_size)
+
+    # Les détections sûres de la passe rapide sont gardées; les candidats incertains
+    # sont remplacés par ce que voient les tuiles
+    parts = {i: [low[i][low[i].conf >= config.accept_conf]] for i in refine}
+    tiles = dict.fromkeys(refine, 0)
+    for (i, x0, y0), r in zip(owners, results):
+        dets = _detections(r)
+        parts[i].append(Detections(dets.xyxy + np.array([x0, y0, x0, y0], dtype=np.float32), dets.cls, dets.conf))
+        tiles[i] += 1
+    for i in refine:
+        merged = Detections(np.concatenate([d.xyxy for d in parts[i]]), np.concatenate([d.cls for d in parts[i]]),
+                            np.concatenate([d.conf for d in parts[i]]), low[i].names)
+        entries[i] = _entry(merged[merge_detections(merged.xyxy, merged.cls, merged.conf)], conf, "tiles",
+                            tiles=tiles[i])
+    METRICS.inc("cascade_refined_tiles", len(refine))
+    METRICS.inc("cascade_tiles", len(crops))
+    return entries
+
+
+def cascade_report(counters):
+    """Bilan des sorties anticipées à partir des compteurs de METRICS.summary()"""
+    images = counters.get("cascade_images", 0)
+    early = counters.get("cascade_early_exit", 0)
+    return {
+        "images": images,
+        "early_exit": early,
+        "refined_full": counters.get("cascade_refined_full", 0),
+        "refined_tiles": counters.get("cascade_refined_tiles", 0),
+        "tiles": counters.get("cascade_tiles", 0),
+        "early_exit_rate": round(early / images, 4) if images else None,
+    }
+
+
+# ---------------------------------------
+# 📏 RÉGLAGE DES SEUILS
+# ---------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Cascade : rappel, latence et sorties anticipées par seuil")
+    parser.add_argument("images", help="Dossier d'images annotées")
+    parser.add_argument("--labels", default=None, help="Dossier des .txt YOLO (défaut : ../labels)")
+    parser.add_argument("--weights", default=MODEL_PATH)
+    parser.add_argument("--low-imgsz", type=int, default=DEFAULT_LOW_IMGSZ)
+    parser.add_argument("--accept", type=float, nargs="+", default=[DEFAULT_ACCEPT_CONF])
+    parser.add_argument("--candidate", type=float, default=DEFAULT_CANDIDATE_CONF)
+    parser.add_argument("--refine", nargs="+", choices=REFINE_MODES, default=["full"])
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    labels_dir = args.labels or os.path.join(os.path.dirname(os.path.normpath(args.images)), "labels")
+    paths = sorted(p for ext in ("jpg", "jpeg", "png") for p in glob.glob(os.path.join(args.images, f"*.{ext}")))
+    paths = paths[:args.limit]
+    model = load_yolo(args.weights)
+    if model is None:
+        raise SystemExit(f"❌ Modèle introuvable : {args.weights}")
+    predict_many = partial(predict_batched, model)
+
+    images, truths = [], []
+    for path in paths:
+        with open(path, "rb") as f:
+            image = decode_image(f.read())
+        height, width = image.shape[:2]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        images.append(image)
+        truths.append(load_labels(os.path.join(labels_dir, f"{stem}.txt"), width, height))
+    total_truth = sum(len(t) for t in truths)
+
+    def evaluate(run):
+        found, seconds, early = 0, 0.0, 0
+        for image, truth in zip(images, truths):
+            started = time.perf_counter()
+            entry = run(image)
+            seconds += time.perf_counter() - started
+            found += count_matches(truth, entry["boxes"])
+            early += entry.get("cascade") == "low"
+        return {
+            "recall": round(found / total_truth, 4) if total_truth else None,
+            "ms_per_image": round(1000.0 * seconds / len(images), 1) if images else None,
+            "early_exit_rate": round(early / len(images), 4) if images else None,
+        }
+
+    model.predict(np.zeros((DEFAULT_IMGSZ, DEFAULT_IMGSZ, 3), dtype=np.uint8), verbose=False)
+    report = {"baseline": evaluate(lambda image: Detections.from_result(
+        model.predict(image, conf=args.conf, imgsz=DEFAULT_IMGSZ, verbose=False)[0]).to_entry())}
+    for refine in args.refine:
+        for accept in args.accept:
+            config = CascadeConfig(low_imgsz=args.low_imgsz, accept_conf=accept,
+                                   candidate_conf=args.candidate, refine=refine)
+            report[f"{refine}@{accept:.2f}"] = evaluate(
+                lambda image: cascade_predict_many(predict_many, [image], config, conf=args.conf, batch_size=1)[0]
+            )
+    report["images"] = len(images)
+    report["ground_truth_boxes"] = total_truth
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# classifier.py
+# Deuxième étage optionnel : classification fine de chaque boîte YOLO par un des
+# classifieurs Keras de saved_models/, toutes les découpes en un seul lot 224×224
+import json
+import os
+import time
+
+import numpy as np
+
+from inference import module_available
+from metrics import METRICS
+
+CLASSIFIER_DIR = "saved_models"
+MODEL_EXTENSIONS = (".keras", ".h5")
+# Normalisation des pixels attendue par chaque architecture (celle de l'entraînement) :
+# les .h5 n'embarquent pas de couche Rescaling
+PREPROCESSING = {
+    "cnn_baseline": "unit",        # [0, 1]
+    "mobilenetv2": "symmetric",    # [-1, 1], keras.applications.mobilenet_v2
+    "efficientnet": "raw",         # [0, 255], normalisation incluse dans le modèle
+}
+# Marge autour de chaque boîte avant découpe (fraction de la taille de la boîte)
+CROP_PADDING = 0.05
+
+
+def load_metadata(directory=CLASSIFIER_DIR):
+    with open(os.path.join(directory, "metadata.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def rank_classifiers(metadata):
+    """Noms des classifieurs du meilleur au moins bon (précision de validation)"""
+    performance = metadata.get("models_performance", {})
+    return sorted(performance, key=lambda name: -performance[name].get("accuracy", 0.0))
+
+
+def _model_path(directory, name):
+    for ext in MODEL_EXTENSIONS:
+        path = os.path.join(directory, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def resolve_classifier(directory=CLASSIFIER_DIR, name=None):
+    """Choisit le classifieur : `name`, sinon le mieux noté de metadata.json présent sur disque.
+
+    Renvoie {"name", "path", "accuracy", "best", "fallback"} où `best` est le
+    mieux noté et `fallback` indique qu'il manque et qu'un autre le remplace.
+    """
+    metadata = load_metadata(directory)
+    ranked = rank_classifiers(metadata)
+    candidates = [name] if name else ranked
+    for candidate in candidates:
+        path = _model_path(directory, candidate)
+        if path is not None:
+            accuracy = metadata.get("models_performance", {}).get(candidate, {}).get("accuracy")
+            best = ranked[0] if ranked else candidate
+            return {"name": candidate, "path": path, "accuracy": accuracy, "best": best,
+                    "fallback": candidate != best}
+    raise FileNotFoundError(f"Aucun classifieur parmi {', '.join(candidates)} dans {directory}")
+
+
+def classifier_available(directory=CLASSIFIER_DIR):
+    """Vrai si un runtime Keras est installé et qu'un classifieur est présent"""
+    if not (module_available("keras") or module_available("tensorflow")):
+        return False
+    try:
+        resolve_classifier(directory)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def crop_batch(image, boxes, size, padding=CROP_PADDING):
+    """Découpes des boîtes `boxes` (xyxy, repère de `image`) redimensionnées en un lot (N, h, w, 3)"""
+    height, width = image.shape[:2]
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    pad = (boxes[:, 2:] - boxes[:, :2]) * padding
+    x1y1 = np.floor(boxes[:, :2] - pad).astype(int)
+    x2y2 = np.ceil(boxes[:, 2:] + pad).astype(int)
+    x1y1 = np.clip(x1y1, 0, [width - 1, height - 1])
+    x2y2 = np.maximum(np.clip(x2y2, 0, [width, height]), x1y1 + 1)
+
+    batch = np.empty((len(boxes), size[0], size[1], 3), dtype=np.uint8)
+    if module_available("cv2"):
+        import cv2
+        for i, ((x1, y1), (x2, y2)) in enumerate(zip(x1y1.tolist(), x2y2.tolist())):
+            batch[i] = cv2.resize(image[y1:y2, x1:x2], (size[1], size[0]), interpolation=cv2.INTER_AREA)
+    else:
+        from PIL import Image
+        for i, ((x1, y1), (x2, y2)) in enumerate(zip(x1y1.tolist(), x2y2.tolist())):
+            batch[i] = np.asarray(Image.fromarray(image[y1:y2, x1:x2]).resize((size[1], size[0]), Image.BILINEAR))
+    return batch
+
+
+def preprocess(batch, mode):
+    batch = batch.astype(np.float32)
+    if mode == "unit":
+        batch /= 255.0
+    elif mode == "symmetric":
+        batch = batch / 127.5 - 1.0
+    return batch
+
+
+class Classifier:
+    """Classifieur Keras chargé une fois, préchauffé, appelé une fois par image"""
+
+    def __init__(self, directory=CLASSIFIER_DIR, name=None):
+        choice = resolve_classifier(directory, name)
+        metadata = load_metadata(directory)
+        try:
+            import keras
+        except ImportError:
+            from tensorflow import keras
+
+        self.name = choice["name"]
+        self.path = choice["path"]
+        self.accuracy = choice["accuracy"]
+        self.best = choice["best"]
+        self.fallback = choice["fallback"]
+        self.class_names = metadata["class_names"]
+        self.size = tuple(metadata.get("img_size", (224, 224)))
+        self.preprocessing = PREPROCESSING.get(self.name, "unit")
+
+        started = time.perf_counter()
+        self.model = keras.models.load_model(self.path, compile=False)
+        self.load_seconds = time.perf_counter() - started
+        # Inférence à blanc : trace le graphe avant le premier vrai lot
+        self.model.predict_on_batch(np.zeros((1, *self.size, 3), dtype=np.float32))
+
+    def classify(self, image, boxes, box_scale=1.0):
+        """Classe chaque boîte en un seul appel; `box_scale` ramène les boîtes dans le repère de `image`.
+
+        Renvoie {"labels", "scores", "crop_ms", "classify_ms"}.
+        """
+        if len(boxes) == 0:
+            return {"labels": [], "scores": [], "crop_ms": 0.0, "classify_ms": 0.0}
+        started = time.perf_counter()
+        crops = crop_batch(image, np.asarray(boxes, dtype=np.float32) * box_scale, self.size)
+        cropped = time.perf_counter()
+        probabilities = np.asarray(self.model.predict_on_batch(preprocess(crops, self.preprocessing)))
+        finished = time.perf_counter()
+        METRICS.observe("classify_crop", cropped - started)
+        METRICS.observe("classify_predict", finished - cropped)
+
+        best = probabilities.argmax(axis=1)
+        return {
+            "labels": [self.class_names[i] for i in best.tolist()],
+            "scores": probabilities[np.arange(len(best)), best].astype(np.float64).round(4).tolist(),
+            "crop_ms": round(1000.0 * (cropped - started), 2),
+            "classify_ms": round(1000.0 * (finished - cropped), 2),
+        }
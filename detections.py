@@ -0,0 +1,109 @@
+# detections.py
+# Résultat de détection compact, stocké en tableaux NumPy (xyxy / classes / scores),
+# avec comptage par classe et filtrage vectorisés
+import numpy as np
+
+
+class Detections:
+    """Détections d'une image : `xyxy` (N, 4), `cls` (N,), `conf` (N,) et noms de classes.
+
+    Se construit depuis un résultat YOLO ou une entrée compacte (voir result_cache)
+    sans boucle Python par boîte.
+    """
+
+    __slots__ = ("xyxy", "cls", "conf", "names")
+
+    def __init__(self, xyxy, cls, conf, names=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.names = names or {}
+
+    @classmethod
+    def empty(cls, names=None):
+        return cls(np.zeros((0, 4)), [], [], names)
+
+    @classmethod
+    def from_result(cls, r):
+        """Depuis un objet Results ultralytics (une copie GPU → CPU par tableau)"""
+        boxes = getattr(r, "boxes", None)
+        names = getattr(r, "names", None)
+        if boxes is None or len(boxes) == 0:
+            return cls.empty(names)
+        return cls(boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy(), names)
+
+    @classmethod
+    def from_entry(cls, entry, names=None):
+        return cls(entry["boxes"], entry["classes"], entry["scores"], names)
+
+    def to_entry(self):
+        """Entrée compacte sérialisable en JSON (sans aperçu)"""
+        return {
+            "boxes": self.xyxy.astype(np.float64).round(1).tolist(),
+            "classes": self.cls.tolist(),
+            "scores": self.conf.astype(np.float64).round(4).tolist(),
+        }
+
+    def __len__(self):
+        return len(self.cls)
+
+    def __getitem__(self, index):
+        """Sous-ensemble par masque booléen, tableau d'indices ou tranche"""
+        return Detections(self.xyxy[index], self.cls[index], self.conf[index], self.names)
+
+    # ---------------------------------------
+    # 🔎 FILTRES ET AGRÉGATS
+    # ---------------------------------------
+    def filter(self, min_conf=None, classes=None):
+        """Détections au-dessus de `min_conf` et/ou appartenant à `classes` (indices)"""
+        mask = np.ones(len(self), dtype=bool)
+        if min_conf is not None:
+            mask &= self.conf >= min_conf
+        if classes is not None:
+            mask &= np.isin(self.cls, list(classes))
+        return self[mask]
+
+    def class_name(self, index):
+        try:
+            return self.names[index]
+        except (KeyError, IndexError, TypeError):
+            return str(index)
+
+    @property
+    def labels(self):
+        return [self.class_name(int(c)) for c in self.cls]
+
+    def counts(self):
+        """{nom de classe: nombre}, par ordre décroissant"""
+        present, counts = np.unique(self.cls, return_counts=True)
+        order = np.argsort(-counts, kind="stable")
+        return {self.class_name(int(present[i])): int(counts[i]) for i in order}
+
+    def summary(self):
+        """Une ligne par classe : nombre, confiance moyenne et maximale"""
+        if not len(self):
+            return []
+        present, inverse, counts = np.unique(self.cls, return_inverse=True, return_counts=True)
+        mean_conf = np.bincount(inverse, weights=self.conf) / counts
+        max_conf = np.full(len(present), -np.inf)
+        np.maximum.at(max_conf, inverse, self.conf)
+        order = np.argsort(-counts, kind="stable")
+        return [
+            {
+                "Classe": self.class_name(int(present[i])),
+                "Nombre": int(counts[i]),
+                "Confiance moyenne": round(float(mean_conf[i]), 3),
+                "Confiance max": round(float(max_conf[i]), 3),
+            }
+            for i in order
+        ]
+
+    def rows(self):
+        """Une ligne par détection, triée par confiance décroissante"""
+        order = np.argsort(-self.conf, kind="stable")
+        xyxy = self.xyxy[order].round(0).astype(int).tolist()
+        return [
+            {"Classe": self.class_name(int(c)), "Confiance": round(float(s), 3),
+             "x1": b[0], "y1": b[1], "x2": b[2], "y2": b[3]}
+            for c, s, b in zip(self.cls[order], self.conf[order], xyxy)
+        ]
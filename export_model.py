@@ -0,0 +1,194 @@
+# export_model.py
+# Export du checkpoint YOLO vers des formats optimisés CPU (ONNX, OpenVINO, OpenVINO INT8)
+# et contrôle de parité des détections par rapport au modèle PyTorch
+#
+# Usage :
+#   python export_model.py                                    # ONNX + OpenVINO
+#   python export_model.py --int8 --data dataset/data.yaml    # + OpenVINO INT8 (calibration)
+#   python export_model.py --check dossier_images/             # parité uniquement
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from inference import DEFAULT_CONF, DEFAULT_IMGSZ, MODEL_PATH, backend_paths, decode_image, export_manifest_path
+from result_cache import file_hash
+
+# Tolérances par défaut du contrôle de parité
+PARITY_IOU = 0.9
+PARITY_CONF_DELTA = 0.05
+PARITY_INT8_CONF_DELTA = 0.15
+
+
+# ---------------------------------------
+# 📦 EXPORT
+# ---------------------------------------
+def export_all(weights=MODEL_PATH, imgsz=DEFAULT_IMGSZ, int8=False, data=None):
+    """Exporte `weights` et renvoie {backend: chemin} des variantes produites.
+
+    Les sorties sont placées à côté du checkpoint, là où `resolve_backend`
+    les cherche, et l'empreinte du checkpoint source de chacune est notée
+    dans le manifeste d'export : après un réentraînement, les variantes non
+    régénérées sont ignorées par le mode "auto". L'export INT8 OpenVINO
+    nécessite un dataset de calibration.
+    """
+    from ultralytics import YOLO
+
+    targets = backend_paths(weights)
+    exported = {}
+
+    onnx_path = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    exported["onnx"] = _move(onnx_path, targets["onnx"])
+
+    ov_path = YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True)
+    exported["openvino"] = _move(ov_path, targets["openvino"])
+
+    if int8:
+        if not data:
+            raise ValueError("L'export INT8 nécessite --data (dataset de calibration)")
+        # Formes dynamiques comme les autres variantes : "auto" la place en tête, elle doit
+        # accepter la cascade à 320, les tuiles et les lots de plusieurs images
+        int8_path = YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True, int8=True, data=data)
+        exported["openvino-int8"] = _move(int8_path, targets["openvino-int8"])
+
+    _record_sources(weights, exported)
+    return exported
+
+
+def _record_sources(weights, exported):
+    """Note l'empreinte de `weights` pour chaque variante produite (les autres gardent la leur)"""
+    manifest = export_manifest_path(weights)
+    try:
+        with open(manifest, encoding="utf-8") as f:
+            sources = json.load(f)
+    except (OSError, ValueError):
+        sources = {}
+    source = file_hash(weights)
+    sources.update({name: source for name in exported})
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(sources, f, indent=2)
+
+
+def _move(src, dst):
+    src = str(src)
+    if os.path.abspath(src) != os.path.abspath(dst):
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        elif os.path.exists(dst):
+            os.remove(dst)
+        shutil.move(src, dst)
+    return dst
+
+
+# ---------------------------------------
+# ⚖️ CONTRÔLE DE PARITÉ
+# ---------------------------------------
+def _iou_matrix(a, b):
+    """IoU entre deux ensembles de boîtes xyxy (N, 4) et (M, 4)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare_detections(ref, other, min_iou=PARITY_IOU, max_conf_delta=PARITY_CONF_DELTA):
+    """Compare deux résultats YOLO : même nombre de boîtes, appariées par IoU,
+    même classe et écart de confiance borné. Renvoie une liste d'écarts."""
+    ref_xyxy = ref.boxes.xyxy.cpu().numpy()
+    other_xyxy = other.boxes.xyxy.cpu().numpy()
+    if len(ref_xyxy) != len(other_xyxy):
+        return [f"{len(ref_xyxy)} boîtes attendues, {len(other_xyxy)} obtenues"]
+
+    issues = []
+    ious = _iou_matrix(ref_xyxy, other_xyxy)
+    ref_cls, other_cls = ref.boxes.cls.tolist(), other.boxes.cls.tolist()
+    ref_conf, other_conf = ref.boxes.conf.tolist(), other.boxes.conf.tolist()
+    for i in range(len(ref_xyxy)):
+        j = int(ious[i].argmax())
+        if ious[i, j] < min_iou:
+            issues.append(f"boîte #{i}: IoU {ious[i, j]:.3f} < {min_iou}")
+        elif ref_cls[i] != other_cls[j]:
+            issues.append(f"boîte #{i}: classe {int(ref_cls[i])} ≠ {int(other_cls[j])}")
+        elif abs(ref_conf[i] - other_conf[j]) > max_conf_delta:
+            issues.append(f"boîte #{i}: confiance {ref_conf[i]:.3f} vs {other_conf[j]:.3f}")
+    return issues
+
+
+def check_parity(weights=MODEL_PATH, images=(), backends=None, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ):
+    """Compare chaque backend exporté au modèle PyTorch sur les mêmes images.
+
+    Renvoie {backend: {image: [écarts]}}; un backend conforme n'a que des listes vides.
+    """
+    from ultralytics import YOLO
+
+    paths = backend_paths(weights)
+    backends = backends or [b for b in paths if b != "pytorch" and os.path.exists(paths[b])]
+    arrays = []
+    for path in images:
+        with open(path, "rb") as f:
+            arrays.append(decode_image(f.read()))
+
+    reference = YOLO(weights).predict(arrays, conf=conf, imgsz=imgsz, verbose=False)
+    report = {}
+    for backend in backends:
+        candidate = YOLO(paths[backend], task="detect").predict(arrays, conf=conf, imgsz=imgsz, verbose=False)
+        delta = PARITY_INT8_CONF_DELTA if backend.endswith("int8") else PARITY_CONF_DELTA
+        report[backend] = {
+            os.path.basename(path): compare_detections(ref, other, max_conf_delta=delta)
+            for path, ref, other in zip(images, reference, candidate)
+        }
+    return report
+
+
+# ---------------------------------------
+# 🚀 POINT D'ENTRÉE
+# ---------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Export ONNX/OpenVINO et contrôle de parité")
+    parser.add_argument("--weights", default=MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--int8", action="store_true", help="Exporter aussi OpenVINO INT8")
+    parser.add_argument("--data", default=None, help="data.yaml de calibration pour l'INT8")
+    parser.add_argument("--check", metavar="DOSSIER", default=None,
+                        help="Contrôler la parité sur les images du dossier (sans ré-export)")
+    parser.add_argument("--max-images", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.check is None:
+        exported = export_all(args.weights, imgsz=args.imgsz, int8=args.int8, data=args.data)
+        print(json.dumps(exported, indent=2))
+        check_dir = os.path.dirname(args.weights) or "."
+    else:
+        check_dir = args.check
+
+    images = sorted(
+        p for ext in ("jpg", "jpeg", "png", "webp") for p in glob.glob(os.path.join(check_dir, f"*.{ext}"))
+    )[:args.max_images]
+    if not images:
+        print(f"⚠️ Aucune image dans {check_dir} : parité non contrôlée")
+        return
+
+    report = check_parity(args.weights, images, imgsz=args.imgsz)
+    failed = False
+    for backend, per_image in report.items():
+        issues = {name: found for name, found in per_image.items() if found}
+        status = "✅" if not issues else "❌"
+        failed = failed or bool(issues)
+        print(f"{status} {backend}: {len(per_image) - len(issues)}/{len(per_image)} images conformes")
+        for name, found in issues.items():
+            print(f"   - {name}: {'; '.join(found)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
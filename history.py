@@ -0,0 +1,391 @@
+# history.py
+# Historique persistant des détections : SQLite en mode WAL, écritures groupées par un
+# thread de fond, lignes compactes et agrégats horaires tenus à jour à l'écriture
+#
+# Usage :
+#   python history.py summary --db history.db --hours 24
+#   python history.py rebuild --db history.db          # recalcule les agrégats
+#   python history.py bench --rows 1000000              # agrégats vs lignes brutes
+import argparse
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from metrics import METRICS
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_QUEUE_SIZE = 10000
+# Confiance stockée en entier (millièmes), boîtes en pixels entiers
+CONF_SCALE = 1000
+HOUR = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cameras (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS class_names (
+    cls INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    camera_id INTEGER NOT NULL,
+    image_hash BLOB NOT NULL,
+    detections INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_ts ON analyses (ts);
+CREATE INDEX IF NOT EXISTS analyses_camera_ts ON analyses (camera_id, ts);
+CREATE INDEX IF NOT EXISTS analyses_hash ON analyses (image_hash);
+CREATE TABLE IF NOT EXISTS detections (
+    analysis_id INTEGER NOT NULL,
+    cls INTEGER NOT NULL,
+    conf INTEGER NOT NULL,
+    x1 INTEGER NOT NULL,
+    y1 INTEGER NOT NULL,
+    x2 INTEGER NOT NULL,
+    y2 INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS detections_analysis ON detections (analysis_id);
+CREATE TABLE IF NOT EXISTS hourly_class_counts (
+    hour INTEGER NOT NULL,
+    camera_id INTEGER NOT NULL,
+    cls INTEGER NOT NULL,
+    detections INTEGER NOT NULL,
+    conf_sum INTEGER NOT NULL,
+    PRIMARY KEY (hour, camera_id, cls)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hourly_analyses (
+    hour INTEGER NOT NULL,
+    camera_id INTEGER NOT NULL,
+    analyses INTEGER NOT NULL,
+    detections INTEGER NOT NULL,
+    PRIMARY KEY (hour, camera_id)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO cameras (id, name) VALUES (0, '');
+"""
+
+UPSERT_CLASS_COUNTS = """
+INSERT INTO hourly_class_counts (hour, camera_id, cls, detections, conf_sum) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (hour, camera_id, cls) DO UPDATE SET
+    detections = detections + excluded.detections,
+    conf_sum = conf_sum + excluded.conf_sum
+"""
+UPSERT_ANALYSES = """
+INSERT INTO hourly_analyses (hour, camera_id, analyses, detections) VALUES (?, ?, ?, ?)
+ON CONFLICT (hour, camera_id) DO UPDATE SET
+    analyses = analyses + excluded.analyses,
+    detections = detections + excluded.detections
+"""
+
+
+def connect(path):
+    """Connexion WAL : lectures concurrentes des écritures, plusieurs processus possibles"""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _compact(entry):
+    """(classes, confiances en millièmes, boîtes en pixels entiers) d'une entrée compacte"""
+    return (
+        [int(c) for c in entry["classes"]],
+        [int(round(s * CONF_SCALE)) for s in entry["scores"]],
+        [tuple(int(round(v)) for v in box) for box in entry["boxes"]],
+    )
+
+
+# ---------------------------------------
+# 🗄️ MAGASIN D'HISTORIQUE
+# ---------------------------------------
+class DetectionStore:
+    """Historique des analyses, alimenté sans bloquer l'appelant.
+
+    `record` met l'analyse en file et rend la main; un thread de fond écrit
+    les analyses par lots (une transaction par lot) et met à jour dans la
+    même transaction les agrégats horaires par caméra et par classe, que
+    lisent les requêtes de tableau de bord. Si la file est pleine, l'analyse
+    est abandonnée et comptée dans `dropped`.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_queue=DEFAULT_QUEUE_SIZE):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._names = None
+        self._readers = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = connect(path)
+        conn.executescript(SCHEMA)
+        conn.commit()
+        conn.close()
+
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    # ---------------------------------------
+    # ✍️ ÉCRITURE
+    # ---------------------------------------
+    def record(self, image_hash, entry, camera=None, names=None, ts=None):
+        """Met en file une analyse (hash hexadécimal de l'image, entrée compacte); non bloquant"""
+        if names is not None and names is not self._names:
+            self._names = names
+            self._put(("names", dict(names)))
+        self._put(("analysis", int(ts if ts is not None else time.time()), camera or "",
+                   bytes.fromhex(image_hash), _compact(entry)))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            METRICS.inc("history_dropped")
+
+    def flush(self):
+        """Attend que tout ce qui est en file soit écrit"""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        conn = connect(self.path)
+        cameras = dict(conn.execute("SELECT name, id FROM cameras"))
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                conn.close()
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            started = time.perf_counter()
+            try:
+                self._write(conn, cameras, batch)
+                self.written += sum(1 for item in batch if item[0] == "analysis")
+                self.batches += 1
+            except sqlite3.Error:
+                conn.rollback()
+                METRICS.inc("history_errors")
+            METRICS.observe("history_write", time.perf_counter() - started)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, conn, cameras, batch):
+        rows, class_counts, analysis_counts = [], Counter(), Counter()
+        conf_sums = Counter()
+        with conn:
+            for item in batch:
+                if item[0] == "names":
+                    conn.executemany("INSERT OR REPLACE INTO class_names (cls, name) VALUES (?, ?)",
+                                     [(int(k), str(v)) for k, v in item[1].items()])
+                    continue
+                _, ts, camera, digest, (classes, confs, boxes) = item
+                if camera not in cameras:
+                    conn.execute("INSERT OR IGNORE INTO cameras (name) VALUES (?)", (camera,))
+                    cameras[camera] = conn.execute("SELECT id FROM cameras WHERE name = ?", (camera,)).fetchone()[0]
+                camera_id = cameras[camera]
+                analysis_id = conn.execute(
+                    "INSERT INTO analyses (ts, camera_id, image_hash, detections) VALUES (?, ?, ?, ?)",
+                    (ts, camera_id, digest, len(classes)),
+                ).lastrowid
+                hour = ts - ts % HOUR
+                analysis_counts[(hour, camera_id)] += 1
+                for cls, conf, box in zip(classes, confs, boxes):
+                    rows.append((analysis_id, cls, conf, *box))
+                    class_counts[(hour, camera_id, cls)] += 1
+                    conf_sums[(hour, camera_id, cls)] += conf
+            conn.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany(UPSERT_CLASS_COUNTS,
+                             [(*key, count, conf_sums[key]) for key, count in class_counts.items()])
+            detections_by_key = Counter()
+            for (hour, camera_id, _), count in class_counts.items():
+                detections_by_key[(hour, camera_id)] += count
+            conn.executemany(UPSERT_ANALYSES,
+                             [(*key, count, detections_by_key[key]) for key, count in analysis_counts.items()])
+
+    # ---------------------------------------
+    # 📊 REQUÊTES (AGRÉGATS HORAIRES)
+    # ---------------------------------------
+    def _reader(self):
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = self._readers.conn = connect(self.path)
+        return conn
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped, "batches": self.batches,
+                "queue_depth": self._queue.qsize()}
+
+    def class_counts(self, since=None, until=None, camera=None):
+        """Détections par classe sur la période : nom, nombre, confiance moyenne"""
+        where, params = _filters(since, until, camera)
+        rows = self._reader().execute(f"""
+            SELECT h.cls, COALESCE(n.name, CAST(h.cls AS TEXT)), SUM(h.detections), SUM(h.conf_sum)
+            FROM hourly_class_counts h LEFT JOIN class_names n ON n.cls = h.cls
+            {where} GROUP BY h.cls ORDER BY SUM(h.detections) DESC
+        """, params).fetchall()
+        return [
+            {"cls": cls, "Classe": name, "Nombre": count,
+             "Confiance moyenne": round(conf_sum / CONF_SCALE / count, 3) if count else None}
+            for cls, name, count, conf_sum in rows
+        ]
+
+    def camera_counts(self, since=None, until=None):
+        """Analyses et détections par caméra sur la période"""
+        where, params = _filters(since, until)
+        rows = self._reader().execute(f"""
+            SELECT c.name, SUM(h.analyses), SUM(h.detections)
+            FROM hourly_analyses h JOIN cameras c ON c.id = h.camera_id
+            {where} GROUP BY h.camera_id ORDER BY SUM(h.detections) DESC
+        """, params).fetchall()
+        return [{"Caméra": name or "-", "Analyses": analyses, "Détections": detections}
+                for name, analyses, detections in rows]
+
+    def hourly_counts(self, since=None, until=None, camera=None, cls=None):
+        """Détections par heure (début d'heure en secondes epoch)"""
+        where, params = _filters(since, until, camera, cls)
+        rows = self._reader().execute(f"""
+            SELECT h.hour, SUM(h.detections) FROM hourly_class_counts h
+            {where} GROUP BY h.hour ORDER BY h.hour
+        """, params).fetchall()
+        return [{"hour": hour, "detections": count} for hour, count in rows]
+
+
+def _filters(since=None, until=None, camera=None, cls=None):
+    """Clause WHERE sur les agrégats (heures entières, caméra par nom, classe par indice)"""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("h.hour >= ?")
+        params.append(int(since) - int(since) % HOUR)
+    if until is not None:
+        clauses.append("h.hour < ?")
+        params.append(int(until))
+    if camera is not None:
+        clauses.append("h.camera_id = (SELECT id FROM cameras WHERE name = ?)")
+        params.append(camera)
+    if cls is not None:
+        clauses.append("h.cls = ?")
+        params.append(int(cls))
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def rebuild_rollups(conn):
+    """Recalcule les agrégats horaires depuis les lignes brutes"""
+    with conn:
+        conn.execute("DELETE FROM hourly_class_counts")
+        conn.execute("DELETE FROM hourly_analyses")
+        conn.execute(f"""
+            INSERT INTO hourly_class_counts (hour, camera_id, cls, detections, conf_sum)
+            SELECT a.ts - a.ts % {HOUR}, a.camera_id, d.cls, COUNT(*), SUM(d.conf)
+            FROM detections d JOIN analyses a ON a.id = d.analysis_id
+            GROUP BY 1, 2, 3
+        """)
+        conn.execute(f"""
+            INSERT INTO hourly_analyses (hour, camera_id, analyses, detections)
+            SELECT ts - ts % {HOUR}, camera_id, COUNT(*), SUM(detections)
+            FROM analyses GROUP BY 1, 2
+        """)
+
+
+def store_from_env():
+    """Magasin désigné par DETECTION_HISTORY_DB, ou None si l'historique est désactivé"""
+    path = os.environ.get("DETECTION_HISTORY_DB")
+    return DetectionStore(path) if path else None
+
+
+# ---------------------------------------
+# 🚀 POINT D'ENTRÉE
+# ---------------------------------------
+def _bench(rows, cameras=8, classes=4):
+    """Remplit une base temporaire puis compare agrégats et lignes brutes"""
+    import random
+
+    path = os.path.join(tempfile.mkdtemp(prefix="history-bench-"), "history.db")
+    store = DetectionStore(path, batch_size=5000, max_queue=rows + 1)
+    now = int(time.time())
+    started = time.perf_counter()
+    for i in range(rows):
+        n = random.randint(0, 3)
+        entry = {
+            "classes": [random.randrange(classes) for _ in range(n)],
+            "scores": [random.random() for _ in range(n)],
+            "boxes": [[10.0, 20.0, 110.0, 220.0]] * n,
+        }
+        store.record(f"{i:064x}", entry, camera=f"cam-{i % cameras}", ts=now - random.randrange(30 * 24 * HOUR))
+    store.flush()
+    print(f"✍️ {rows} analyses écrites en {time.perf_counter() - started:.1f}s ({store.batches} lots)")
+
+    since = now - 24 * HOUR
+    for label, run in (
+        ("agrégats", lambda: store.class_counts(since=since)),
+        ("lignes brutes", lambda: connect(path).execute(
+            "SELECT d.cls, COUNT(*) FROM detections d JOIN analyses a ON a.id = d.analysis_id "
+            "WHERE a.ts >= ? GROUP BY d.cls", (since,)).fetchall())
+    ):
+        started = time.perf_counter()
+        run()
+        print(f"  {label:<14} {1000.0 * (time.perf_counter() - started):.1f} ms")
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Historique des détections (SQLite)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary_parser = sub.add_parser("summary", help="Comptes par classe, caméra et heure")
+    summary_parser.add_argument("--db", default=os.environ.get("DETECTION_HISTORY_DB", "history.db"))
+    summary_parser.add_argument("--hours", type=int, default=24)
+    summary_parser.add_argument("--camera", default=None)
+    rebuild_parser = sub.add_parser("rebuild", help="Recalcule les agrégats depuis les lignes brutes")
+    rebuild_parser.add_argument("--db", default=os.environ.get("DETECTION_HISTORY_DB", "history.db"))
+    bench_parser = sub.add_parser("bench", help="Temps de requête : agrégats vs lignes brutes")
+    bench_parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        _bench(args.rows)
+    elif args.command == "rebuild":
+        rebuild_rollups(connect(args.db))
+        print(f"✅ Agrégats recalculés : {args.db}")
+    else:
+        store = DetectionStore(args.db)
+        since = time.time() - args.hours * HOUR
+        print(f"📊 Dernières {args.hours} h")
+        for row in store.class_counts(since=since, camera=args.camera):
+            print(f"  {row['Classe']:<20} {row['Nombre']:>8}  conf. moy. {row['Confiance moyenne']}")
+        for row in store.camera_counts(since=since):
+            print(f"  📷 {row['Caméra']:<18} {row['Analyses']:>8} analyses  {row['Détections']:>8} détections")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# inference.py
+# Outils d'inférence YOLO partagés, indépendants de l'interface Streamlit
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from result_cache import file_hash
+
+# ---------------------------------------
+# ⚙️ PARAMÈTRES PAR DÉFAUT
+# ---------------------------------------
+MODEL_PATH = "models/best.pt"
+DEFAULT_CONF = 0.25
+DEFAULT_IMGSZ = 640
+DEFAULT_BATCH_SIZE = 8
+# Plafond par défaut des pixels décodés pour une seule image (API, traitement en masse)
+DEFAULT_MAX_DECODE_MB = 512
+# Balise EXIF « Orientation »
+EXIF_ORIENTATION = 0x0112
+
+
+# Backends essayés dans l'ordre par le mode "auto", du plus rapide sur CPU au plus lent
+BACKEND_PRIORITY = ("openvino-int8", "openvino", "onnx", "pytorch")
+BACKEND_RUNTIMES = {
+    "openvino-int8": "openvino",
+    "openvino": "openvino",
+    "onnx": "onnxruntime",
+    "pytorch": "torch",
+}
+
+
+# ---------------------------------------
+# 🧠 CHARGEMENT DU MODÈLE
+# ---------------------------------------
+def backend_paths(path=MODEL_PATH):
+    """Chemins des variantes exportées d'un checkpoint `.pt` (voir export_model.py)"""
+    stem = os.path.splitext(path)[0]
+    return {
+        "openvino-int8": f"{stem}_int8_openvino_model",
+        "openvino": f"{stem}_openvino_model",
+        "onnx": f"{stem}.onnx",
+        "pytorch": path,
+    }
+
+
+def export_manifest_path(path=MODEL_PATH):
+    """Fichier où export_model.py note l'empreinte du checkpoint source de chaque variante"""
+    return f"{os.path.splitext(path)[0]}_exports.json"
+
+
+def export_is_current(path, name):
+    """Vrai si la variante `name` a été exportée depuis la version actuelle de `path`.
+
+    L'empreinte notée par `export_all` fait foi; pour une variante sans
+    empreinte (export manuel ou antérieur), on compare les dates : plus
+    ancienne que le checkpoint, elle vient d'un entraînement précédent.
+    """
+    if name == "pytorch" or not os.path.exists(path):
+        return True
+    try:
+        with open(export_manifest_path(path), encoding="utf-8") as f:
+            sources = json.load(f)
+    except (OSError, ValueError):
+        sources = {}
+    if name in sources:
+        return sources[name] == file_hash(path)
+    return os.path.getmtime(backend_paths(path)[name]) >= os.path.getmtime(path)
+
+
+def module_available(module_name):
+    """Vrai si le module est installé, sans l'importer (pas de coût au démarrage)"""
+    import importlib.util
+    return importlib.util.find_spec(module_name) is not None
+
+
+def resolve_backend(path=MODEL_PATH, backend=None):
+    """Choisit le backend d'inférence et renvoie (nom, chemin).
+
+    `backend` vaut "auto" (défaut, ou variable INFERENCE_BACKEND) pour prendre
+    la première variante exportée dont le runtime est installé et qui provient
+    du checkpoint actuel (voir `export_is_current`), sinon le nom d'un backend
+    précis. Sans variante disponible, on retombe sur PyTorch.
+    """
+    backend = backend or os.environ.get("INFERENCE_BACKEND", "auto")
+    paths = backend_paths(path)
+    if backend != "auto":
+        if backend not in paths:
+            raise ValueError(f"Backend inconnu : {backend} (choix : {', '.join(paths)})")
+        return backend, paths[backend]
+    for name in BACKEND_PRIORITY:
+        if (os.path.exists(paths[name]) and module_available(BACKEND_RUNTIMES[name])
+                and export_is_current(path, name)):
+            return name, paths[name]
+    return "pytorch", path
+
+
+def load_yolo(path=MODEL_PATH, backend=None):
+    """Charge un modèle YOLO; renvoie None si le fichier est absent.
+
+    Le checkpoint PyTorch sert de référence : s'il manque, rien n'est chargé.
+    Les erreurs de chargement sont propagées : à l'appelant de les afficher.
+    """
+    if not os.path.exists(path):
+        return None
+    from ultralytics import YOLO
+    _, resolved = resolve_backend(path, backend)
+    return YOLO(resolved, task="detect")
+
+
+def warmup(model, imgsz=DEFAULT_IMGSZ, runs=1):
+    """Inférence à blanc : initialise le graphe et les allocateurs avant le premier vrai appel"""
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(max(1, runs)):
+        model.predict(dummy, imgsz=imgsz, verbose=False)
+    return model
+
+
+# ---------------------------------------
+# 🖼️ DÉCODAGE DES IMAGES
+# ---------------------------------------
+def decode_image(data):
+    """Décode des octets d'image en tableau RGB (H, W, 3), orientation EXIF appliquée"""
+    return np.array(ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB"))
+
+
+def _oriented_size(image):
+    """(largeur, hauteur) une fois l'orientation EXIF appliquée, sans décoder"""
+    width, height = image.size
+    try:
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        orientation = 1
+    return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+
+
+def image_size(data):
+    """(largeur, hauteur) de l'image orientée, lue dans l'en-tête sans décoder les pixels"""
+    return _oriented_size(Image.open(io.BytesIO(data)))
+
+
+def _draft_request(image, target):
+    """Taille demandée à draft() pour un JPEG plus grand que `target`, sinon None"""
+    long_side = max(image.size)
+    if not target or long_side <= target or image.format != "JPEG":
+        return None
+    ratio = target / long_side
+    return int(np.ceil(image.size[0] * ratio)), int(np.ceil(image.size[1] * ratio))
+
+
+def _decoded_bytes(image, target=None):
+    width, height = image.size
+    request = _draft_request(image, target)
+    if request:
+        # Même choix que PIL (JpegImageFile.draft) : plus forte réduction 1/8, 1/4, 1/2
+        # qui garde au moins la taille demandée
+        scale = min(width // request[0], height // request[1])
+        factor = next(f for f in (8, 4, 2, 1) if scale >= f)
+        width, height = -(-width // factor), -(-height // factor)
+    return width * height * 3
+
+
+def decoded_bytes(data, target=None):
+    """Pic d'octets de pixels RGB du décodage, lu dans l'en-tête sans décoder.
+
+    Un JPEG réduit à `target` n'est décodé qu'à l'échelle choisie par draft();
+    les autres formats (PNG, WebP...) passent par la pleine résolution avant
+    la réduction : c'est cette taille qui compte.
+    """
+    return _decoded_bytes(Image.open(io.BytesIO(data)), target)
+
+
+def check_decode_budget(needed, limit):
+    """Lève MemoryError si `needed` octets décodés dépassent `limit` (None : pas de limite)"""
+    if limit is not None and needed > limit:
+        raise MemoryError(
+            f"Image trop grande : {needed / 1e6:.0f} Mo décodés pour un budget de {limit / 1e6:.0f} Mo"
+        )
+
+
+def decode_reduced(data, target=DEFAULT_IMGSZ, max_bytes=None):
+    """Décode directement à une résolution réduite (côté le plus long ≈ `target`).
+
+    Les JPEG sont décodés à l'échelle 1/2, 1/4 ou 1/8 par libjpeg (mode draft),
+    sans jamais matérialiser la pleine résolution; les autres formats sont
+    réduits après décodage. Avec `max_bytes`, l'image est refusée (MemoryError)
+    avant décodage si son pic mesuré par `decoded_bytes` dépasse ce budget.
+    Renvoie (tableau RGB, échelle) où `échelle` convertit les coordonnées du
+    tableau vers l'image d'origine orientée.
+    """
+    image = Image.open(io.BytesIO(data))
+    check_decode_budget(_decoded_bytes(image, target), max_bytes)
+    long_side = max(_oriented_size(image))
+    request = _draft_request(image, target)
+    if request:
+        # draft() choisit la plus forte réduction qui garde au moins la taille demandée
+        image.draft("RGB", request)
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    if max(image.size) > target:
+        image.thumbnail((target, target), Image.BILINEAR, reducing_gap=2.0)
+    return np.array(image), long_side / max(image.size)
+
+
+def decode_many(blobs, max_workers=None, target=None):
+    """Décode plusieurs images en parallèle.
+
+    Retourne une liste de tuples (tableau, erreur, échelle) dans l'ordre
+    d'entrée : le tableau vaut None et l'erreur est renseignée si le décodage
+    échoue. Avec `target`, le décodage est réduit (voir decode_reduced).
+    """
+    def _safe_decode(data):
+        try:
+            if target:
+                array, scale = decode_reduced(data, target)
+                return array, None, scale
+            return decode_image(data), None, 1.0
+        except Exception as e:
+            return None, str(e), 1.0
+
+    if not blobs:
+        return []
+    workers = max_workers or min(len(blobs), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_safe_decode, blobs))
+
+
+def split_by_budget(sizes, limit):
+    """Découpe des indices en groupes dont la somme des `sizes` reste sous `limit`.
+
+    Une taille seule au-delà de `limit` forme un groupe à part : à l'appelant de
+    la refuser.
+    """
+    group, used = [], 0
+    for index, size in enumerate(sizes):
+        if group and used + size > limit:
+            yield group
+            group, used = [], 0
+        group.append(index)
+        used += size
+    if group:
+        yield group
+
+
+# ---------------------------------------
+# 🚀 INFÉRENCE PAR LOTS
+# ---------------------------------------
+def iter_batches(items, batch_size=DEFAULT_BATCH_SIZE):
+    """Découpe une séquence en lots de taille fixe (le dernier peut être plus court)"""
+    batch_size = max(1, int(batch_size))
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def predict_batched(model, images, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ,
+                    batch_size=DEFAULT_BATCH_SIZE):
+    """Lance un seul appel `predict` par lot et renvoie un résultat par image"""
+    results = []
+    for batch in iter_batches(list(images), batch_size):
+        results.extend(model.predict(list(batch), conf=conf, imgsz=imgsz, verbose=False))
+    return results
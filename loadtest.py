@@ -0,0 +1,409 @@
+# loadtest.py
+# Test de charge de bout en bout de l'application Streamlit : N utilisateurs simulés
+# ouvrent chacun une session websocket, téléversent une image et lancent l'analyse,
+# comme le navigateur (mêmes messages protobuf, même chemin de rerun côté serveur)
+#
+# Usage :
+#   python loadtest.py images/ --users 1 2 4 8 16 --duration 60
+#   python loadtest.py images/ --url http://localhost:8501 --pid 12345   # instance déjà lancée
+#   python loadtest.py images/ --users 4 8 --slo-ms 3000 --env INFERENCE_REPLICAS=2
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from benchmark import git_revision, list_images, percentile
+from startup import APP_SCRIPT
+
+DEFAULT_USERS = (1, 2, 4, 8)
+DEFAULT_PORT = 8599
+ANALYZE_LABEL = "🚀 Lancer l'Analyse IA"
+UPLOADER_KEY = "main_uploader"
+# Le serveur est lancé sans cache de détections : chaque clic refait l'inférence
+SERVER_ENV = {"DETECTION_CACHE_SIZE": "0"}
+SAMPLE_INTERVAL_S = 0.5
+READY_TIMEOUT_S = 300
+
+
+# ---------------------------------------
+# 🖥️ SERVEUR SOUS TEST
+# ---------------------------------------
+def start_app(port, env_overrides=None):
+    """Lance l'application (préchargée via startup.py) et attend /_stcore/health"""
+    env = dict(os.environ, **SERVER_ENV, **(env_overrides or {}))
+    process = subprocess.Popen(
+        [sys.executable, "startup.py", "serve", "--",
+         "--server.headless", "true", "--server.port", str(port),
+         # Les téléversements du générateur n'ont pas de cookie XSRF de navigateur
+         "--server.enableXsrfProtection", "false",
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    from urllib.request import urlopen
+
+    deadline = time.monotonic() + READY_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"L'application s'est arrêtée au démarrage (code {process.returncode})")
+        try:
+            with urlopen(f"http://localhost:{port}/_stcore/health", timeout=2) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise TimeoutError(f"Application non prête après {READY_TIMEOUT_S}s")
+
+
+def process_usage(pid):
+    """(RSS en Mo, temps CPU cumulé en s) du processus et de ses enfants (pool d'inférence)"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+            rss, cpu = 0, 0.0
+            for process in processes:
+                try:
+                    rss += process.memory_info().rss
+                    times = process.cpu_times()
+                    cpu += times.user + times.system
+                except psutil.NoSuchProcess:
+                    pass
+            return rss / (1024 * 1024), cpu
+        except psutil.NoSuchProcess:
+            return None, None
+    # Sans psutil : /proc, processus principal seulement
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        return rss_kb / 1024, (int(fields[11]) + int(fields[12])) / ticks
+    except (OSError, StopIteration, ValueError, IndexError):
+        return None, None
+
+
+class UsageSampler:
+    """Échantillonne RSS et CPU du serveur dans un thread pendant un palier de charge"""
+
+    def __init__(self, pid, interval=SAMPLE_INTERVAL_S):
+        self.pid = pid
+        self.interval = interval
+        self.rss = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="usage-sampler", daemon=True)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._cpu_start = process_usage(self.pid)[1]
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._cpu_end = process_usage(self.pid)[1]
+        self._elapsed = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss, _ = process_usage(self.pid)
+            if rss is not None:
+                self.rss.append(rss)
+
+    def report(self):
+        cpu = None
+        if self._cpu_start is not None and self._cpu_end is not None and self._elapsed > 0:
+            # En % d'un cœur : 400 = quatre cœurs pleinement occupés
+            cpu = round(100.0 * (self._cpu_end - self._cpu_start) / self._elapsed, 1)
+        return {
+            "rss_peak_mb": round(max(self.rss), 1) if self.rss else None,
+            "rss_mean_mb": round(sum(self.rss) / len(self.rss), 1) if self.rss else None,
+            "cpu_pct": cpu,
+        }
+
+
+class _NoSampler:
+    """Instance distante sans PID connu : pas de mesure RSS / CPU"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def report(self):
+        return {"rss_peak_mb": None, "rss_mean_mb": None, "cpu_pct": None}
+
+
+# ---------------------------------------
+# 👤 UTILISATEUR SIMULÉ (PROTOCOLE DU NAVIGATEUR)
+# ---------------------------------------
+def _multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class SimulatedUser:
+    """Une session de navigateur : websocket `/_stcore/stream` et messages BackMsg / ForwardMsg"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.session_id = None
+        self.widget_ids = {}
+        self._conn = None
+        self._request_ids = itertools.count()
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+
+        ws_url = self.base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self._conn = await websocket_connect(ws_url, subprotocols=["streamlit"], max_message_size=1 << 30)
+        # Premier affichage de la page, comme à l'ouverture de l'onglet
+        return await self.rerun([])
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+    async def _send(self, back_msg):
+        await self._conn.write_message(back_msg.SerializeToString(), binary=True)
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        raw = await self._conn.read_message()
+        if raw is None:
+            raise ConnectionError("Websocket fermé par le serveur")
+        msg = ForwardMsg()
+        msg.ParseFromString(raw)
+        return msg
+
+    def _inspect(self, msg, run):
+        """Relève l'identifiant de session, les widgets utiles et les exceptions affichées"""
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id or self.session_id
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            element_type = element.WhichOneof("type")
+            if element_type == "file_uploader" and element.file_uploader.id.endswith(UPLOADER_KEY):
+                self.widget_ids["uploader"] = element.file_uploader.id
+            elif element_type == "button" and element.button.label == ANALYZE_LABEL:
+                self.widget_ids["analyze"] = element.button.id
+            elif element_type == "exception":
+                run["errors"].append(element.exception.message)
+
+    async def rerun(self, widget_states):
+        """Envoie un rerun avec l'état des widgets; renvoie (durée en s, erreurs) à la fin du script"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = ""
+        back_msg.rerun_script.widget_states.widgets.extend(widget_states)
+        started = time.perf_counter()
+        await self._send(back_msg)
+
+        run = {"errors": []}
+        while True:
+            msg = await self._receive()
+            self._inspect(msg, run)
+            if msg.WhichOneof("type") == "script_finished":
+                status = msg.script_finished
+                if status == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    return time.perf_counter() - started, run["errors"]
+                if status == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    return time.perf_counter() - started, run["errors"] + ["Erreur de compilation du script"]
+                # Rerun interrompu par un rerun plus récent : on attend la fin du suivant
+
+    async def upload(self, name, data):
+        """Téléverse un fichier comme le widget file_uploader; renvoie l'état du widget"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.Common_pb2 import FileUploaderState, UploadedFileInfo
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        from tornado.httpclient import AsyncHTTPClient
+
+        request_id = f"load-{next(self._request_ids)}"
+        back_msg = BackMsg()
+        back_msg.file_urls_request.request_id = request_id
+        back_msg.file_urls_request.session_id = self.session_id
+        back_msg.file_urls_request.file_names.append(name)
+        await self._send(back_msg)
+        while True:
+            msg = await self._receive()
+            if msg.WhichOneof("type") == "file_urls_response" and msg.file_urls_response.response_id == request_id:
+                break
+        if msg.file_urls_response.error_msg:
+            raise RuntimeError(msg.file_urls_response.error_msg)
+        urls = msg.file_urls_response.file_urls[0]
+
+        body, content_type = _multipart("file", name, data)
+        await AsyncHTTPClient().fetch(self.base_url + urls.upload_url, method="PUT", body=body,
+                                      headers={"Content-Type": content_type})
+
+        info = UploadedFileInfo(name=name, size=len(data), file_id=urls.file_id)
+        info.file_urls.CopyFrom(urls)
+        state = FileUploaderState(uploaded_file_info=[info])
+        return WidgetState(id=self.widget_ids["uploader"], file_uploader_state_value=state)
+
+    async def analyze(self, name, data):
+        """Téléversement, rerun d'affichage puis clic sur « Lancer l'analyse »; renvoie les mesures"""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        started = time.perf_counter()
+        uploader_state = await self.upload(name, data)
+        _, errors = await self.rerun([uploader_state])
+        if "analyze" not in self.widget_ids:
+            raise RuntimeError("Bouton d'analyse introuvable après le téléversement")
+        click = WidgetState(id=self.widget_ids["analyze"], trigger_value=True)
+        analysis_s, analysis_errors = await self.rerun([uploader_state, click])
+        return {
+            "analysis_s": analysis_s,
+            "total_s": time.perf_counter() - started,
+            "errors": errors + analysis_errors,
+        }
+
+
+# ---------------------------------------
+# 📈 PALIERS DE CHARGE
+# ---------------------------------------
+async def _user_loop(base_url, blobs, deadline, samples, offset):
+    user = SimulatedUser(base_url)
+    try:
+        await user.connect()
+        for name, data in itertools.islice(itertools.cycle(blobs), offset, None):
+            if time.perf_counter() >= deadline:
+                break
+            try:
+                samples.append(await user.analyze(name, data))
+            except Exception as e:
+                samples.append({"analysis_s": None, "total_s": None, "errors": [str(e)]})
+    except Exception as e:
+        samples.append({"analysis_s": None, "total_s": None, "errors": [f"Connexion : {e}"]})
+    finally:
+        user.close()
+
+
+def run_level(base_url, pid, blobs, users, duration):
+    """`users` sessions simultanées pendant `duration` secondes"""
+    samples = []
+
+    async def _run():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(_user_loop(base_url, blobs, deadline, samples, i) for i in range(users)))
+
+    with UsageSampler(pid) if pid else _NoSampler() as sampler:
+        started = time.perf_counter()
+        asyncio.run(_run())
+        elapsed = time.perf_counter() - started
+
+    latencies = [1000.0 * s["analysis_s"] for s in samples if s["analysis_s"] is not None and not s["errors"]]
+    totals = [1000.0 * s["total_s"] for s in samples if s["total_s"] is not None and not s["errors"]]
+    errors = [e for s in samples for e in s["errors"]]
+    return {
+        "users": users,
+        "analyses": len(latencies),
+        "errors": len(errors),
+        "throughput_per_s": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "upload_to_result_p95_ms": round(percentile(totals, 95), 1),
+        **sampler.report(),
+        "sample_errors": sorted(set(errors))[:5],
+    }
+
+
+def capacity(rows, slo_ms):
+    """Plus grand nombre de sessions simultanées dont le p95 tient dans `slo_ms` sans erreur"""
+    fitting = [row["users"] for row in rows if row["analyses"] and not row["errors"] and row["p95_ms"] <= slo_ms]
+    return max(fitting) if fitting else None
+
+
+# ---------------------------------------
+# 🚀 POINT D'ENTRÉE
+# ---------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de l'application Streamlit")
+    parser.add_argument("images", help="Dossier d'images téléversées par les utilisateurs simulés")
+    parser.add_argument("--users", type=int, nargs="+", default=list(DEFAULT_USERS), help="Paliers de concurrence")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durée de chaque palier (s)")
+    parser.add_argument("--limit", type=int, default=16, help="Nombre max. d'images")
+    parser.add_argument("--url", default=None, help="Instance déjà lancée (défaut : lancée par le test)")
+    parser.add_argument("--pid", type=int, default=None, help="PID du serveur pour RSS / CPU avec --url")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--env", nargs="*", default=[], help="Variables du serveur lancé (CLE=valeur)")
+    parser.add_argument("--slo-ms", type=float, default=5000.0, help="p95 maximal de l'analyse")
+    parser.add_argument("--out", default=os.path.join("runs", "loadtest", time.strftime("%Y%m%d-%H%M%S")))
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        raise SystemExit(f"❌ Aucune image dans {args.images}")
+    blobs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            blobs.append((os.path.basename(path), f.read()))
+
+    server = None
+    if args.url:
+        base_url, pid = args.url, args.pid
+    else:
+        env = dict(item.split("=", 1) for item in args.env)
+        print(f"🖥️ Démarrage de {APP_SCRIPT} sur le port {args.port}…")
+        server = start_app(args.port, env)
+        base_url, pid = f"http://localhost:{args.port}", server.pid
+
+    rows = []
+    try:
+        for users in args.users:
+            row = run_level(base_url, pid, blobs, users, args.duration)
+            rows.append(row)
+            print(f"  {users:>3} utilisateurs : {row['throughput_per_s']:.2f} analyses/s  "
+                  f"p50={row['p50_ms']:.0f} ms  p95={row['p95_ms']:.0f} ms  p99={row['p99_ms']:.0f} ms  "
+                  f"RSS={row['rss_peak_mb']} Mo  CPU={row['cpu_pct']}%  erreurs={row['errors']}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    supported = capacity(rows, args.slo_ms)
+    meta = {
+        "commit": git_revision(),
+        "url": base_url if args.url else None,
+        "server_env": {**SERVER_ENV, **dict(item.split("=", 1) for item in args.env)} if not args.url else None,
+        "images": len(blobs),
+        "duration_s": args.duration,
+        "slo_ms": args.slo_ms,
+        "capacity_users": supported,
+        "cpu_count": os.cpu_count(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    os.makedirs(args.out, exist_ok=True)
+    json_path = os.path.join(args.out, "results.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": rows}, f, indent=2)
+    if supported:
+        print(f"🎯 Capacité : {supported} sessions simultanées avec p95 ≤ {args.slo_ms:g} ms")
+    else:
+        print(f"⚠️ Aucun palier ne tient p95 ≤ {args.slo_ms:g} ms sans erreur")
+    print(f"📄 {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# metrics.py
+# Instrumentation du pipeline de détection : durées par étape, compteurs, export Prometheus
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bornes des histogrammes de durée, en secondes
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_SAMPLES = 200
+METRIC_PREFIX = "poubelle"
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * q / 100.0)))]
+
+
+class StageMetrics:
+    """Registre thread-safe des durées par étape et des compteurs"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+
+    # ---------------------------------------
+    # ✍️ ENREGISTREMENT
+    # ---------------------------------------
+    def observe(self, stage, seconds):
+        with self._lock:
+            data = self._stages.get(stage)
+            if data is None:
+                data = self._stages[stage] = {
+                    "count": 0, "sum": 0.0,
+                    "buckets": [0] * len(self.buckets),
+                    "recent": deque(maxlen=RECENT_SAMPLES),
+                }
+            data["count"] += 1
+            data["sum"] += seconds
+            data["recent"].append(seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    data["buckets"][i] += 1
+
+    @contextmanager
+    def stage(self, name):
+        """Chronomètre le bloc et l'enregistre sous `name`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    # ---------------------------------------
+    # 📊 LECTURE
+    # ---------------------------------------
+    def summary(self):
+        """Résumé par étape (ms) sur les derniers échantillons, pour le panneau de debug"""
+        with self._lock:
+            stages = {name: (data["count"], data["sum"], list(data["recent"]))
+                      for name, data in self._stages.items()}
+            counters = dict(self._counters)
+        rows = []
+        for name, (count, total, recent) in stages.items():
+            rows.append({
+                "Étape": name,
+                "Appels": count,
+                "Moyenne (ms)": round(1000.0 * total / count, 2) if count else 0.0,
+                "p50 (ms)": round(1000.0 * _percentile(recent, 50), 2),
+                "p95 (ms)": round(1000.0 * _percentile(recent, 95), 2),
+                "Total (s)": round(total, 3),
+            })
+        rows.sort(key=lambda row: row["Total (s)"], reverse=True)
+        return {"stages": rows, "counters": counters}
+
+    def render_prometheus(self):
+        """Exposition au format texte Prometheus"""
+        with self._lock:
+            stages = {name: (data["count"], data["sum"], list(data["buckets"]))
+                      for name, data in self._stages.items()}
+            counters = dict(self._counters)
+
+        metric = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [
+            f"# HELP {metric} Durée des étapes du pipeline de détection.",
+            f"# TYPE {metric} histogram",
+        ]
+        for name in sorted(stages):
+            count, total, buckets = stages[name]
+            for bound, value in zip(self.buckets, buckets):
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {value}')
+            lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+        for name in sorted(counters):
+            counter = f"{METRIC_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {counter} counter")
+            lines.append(f"{counter} {counters[name]}")
+        return "\n".join(lines) + "\n"
+
+
+# Registre partagé par l'application, l'API et l'ordonnanceur
+METRICS = StageMetrics()
+
+
+# ---------------------------------------
+# 🌐 SERVEUR D'EXPOSITION
+# ---------------------------------------
+def start_metrics_server(port, registry=METRICS, host="0.0.0.0"):
+    """Sert /metrics dans un thread de fond (pour les processus sans routeur HTTP)"""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,37 @@
+# model_info.py
+# Métadonnées du modèle calculées une fois (invalidées si le fichier change)
+import os
+from datetime import datetime
+from functools import lru_cache
+
+from result_cache import file_hash
+
+
+def file_signature(path):
+    """(taille, date de modification en ns) : change dès que le fichier est remplacé"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+@lru_cache(maxsize=16)
+def _metadata(path, size, mtime_ns, names):
+    return {
+        "path": path,
+        "size_bytes": size,
+        "size_mb": size / (1024 * 1024),
+        "sha256": file_hash(path),
+        "modified": datetime.fromtimestamp(mtime_ns / 1e9).strftime("%Y-%m-%d %H:%M"),
+        "class_names": list(names),
+    }
+
+
+def model_metadata(path, names=None):
+    """Taille, empreinte, date et classes du modèle, mises en cache par signature de fichier.
+
+    `names` est le dictionnaire `model.names` du modèle déjà chargé : on évite
+    ainsi de relire le checkpoint pour obtenir les classes.
+    """
+    size, mtime_ns = file_signature(path)
+    names = tuple(names.values()) if isinstance(names, dict) else tuple(names or ())
+    return _metadata(path, size, mtime_ns, names)
+
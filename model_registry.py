@@ -0,0 +1,322 @@
+# model_registry.py
+# Registre multi-modèles : surveille models/, charge et préchauffe en arrière-plan,
+# bascule atomiquement vers les nouveaux checkpoints et garde un LRU de modèles résidents
+import glob
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from inference import DEFAULT_BATCH_SIZE, DEFAULT_IMGSZ, MODEL_PATH, load_yolo, resolve_backend, warmup
+from model_info import file_signature
+from result_cache import model_fingerprint
+from scheduler import BatchScheduler
+
+
+class ModelHandle:
+    """Modèle résident prêt à servir, avec son propre ordonnanceur"""
+
+    def __init__(self, version, path, model, scheduler, signature, memory_mb):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.scheduler = scheduler
+        self.signature = signature
+        self.memory_mb = memory_mb
+        self.backend = resolve_backend(path)[0]
+        self.fingerprint = model_fingerprint(path, self.backend)
+        self.loaded_at = time.time()
+        self.timings = {}
+
+
+def estimate_memory_mb(model, path):
+    """Empreinte mémoire approximative : poids PyTorch, sinon taille du checkpoint"""
+    try:
+        params = model.model.parameters()
+        return sum(p.numel() * p.element_size() for p in params) / (1024 * 1024)
+    except Exception:
+        return os.path.getsize(path) / (1024 * 1024)
+
+
+class ModelRegistry:
+    """Versions de modèle disponibles dans `models_dir` (une par fichier .pt).
+
+    Les chargements se font dans un thread dédié et sont suivis d'une inférence
+    à blanc; le modèle n'est publié qu'une fois prêt, par simple remplacement
+    dans le dictionnaire des résidents. Les requêtes en cours gardent leur
+    référence à l'ancien modèle et ne sont jamais bloquées : une version non
+    encore chargée est servie par la version par défaut le temps du chargement.
+    """
+
+    def __init__(self, models_dir=None, default_version=None, max_resident=2,
+                 max_memory_mb=None, poll_interval=5.0, warmup_imgsz=DEFAULT_IMGSZ,
+                 max_batch_size=DEFAULT_BATCH_SIZE, max_wait_ms=10.0):
+        self.models_dir = models_dir or os.path.dirname(MODEL_PATH) or "."
+        self.default_version = default_version or os.path.splitext(os.path.basename(MODEL_PATH))[0]
+        self.max_resident = max(1, int(max_resident))
+        self.max_memory_mb = max_memory_mb
+        self.poll_interval = poll_interval
+        self.warmup_imgsz = warmup_imgsz
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._resident = OrderedDict()
+        self._pending = set()
+        self._errors = {}
+        # Signature du fichier au moment de l'échec : pas de nouvel essai tant qu'elle ne change pas
+        self._failed = {}
+        # Préchargements refusés faute de place, par signature (même principe que `_failed`)
+        self._declined = {}
+        self._lock = threading.Lock()
+        self._cold_start_lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+        self._stop = threading.Event()
+        self._watcher = None
+
+    # ---------------------------------------
+    # 🔍 VERSIONS DISPONIBLES
+    # ---------------------------------------
+    def versions(self):
+        """{version: chemin} des checkpoints présents, la version par défaut en tête"""
+        found = {
+            os.path.splitext(os.path.basename(path))[0]: path
+            for path in sorted(glob.glob(os.path.join(self.models_dir, "*.pt")))
+        }
+        ordered = {}
+        if self.default_version in found:
+            ordered[self.default_version] = found.pop(self.default_version)
+        ordered.update(found)
+        return ordered
+
+    def _signature(self, version):
+        """Signature du checkpoint de `version` (None s'il n'existe pas)"""
+        try:
+            return file_signature(os.path.join(self.models_dir, f"{version}.pt"))
+        except OSError:
+            return None
+
+    def _backing_off(self, version):
+        """Vrai si `version` a échoué et que son fichier n'a pas changé depuis"""
+        with self._lock:
+            if version not in self._failed:
+                return False
+            failed = self._failed[version]
+        return failed == self._signature(version)
+
+    def status(self):
+        with self._lock:
+            return {
+                "resident": {
+                    v: {"memory_mb": round(h.memory_mb, 1), "backend": h.backend,
+                        "loaded_at": time.strftime("%H:%M:%S", time.localtime(h.loaded_at)), **h.timings}
+                    for v, h in self._resident.items()
+                },
+                "loading": sorted(self._pending),
+                "errors": dict(self._errors),
+            }
+
+    # ---------------------------------------
+    # 🎯 ACCÈS AUX MODÈLES
+    # ---------------------------------------
+    def get(self, version=None):
+        """Renvoie le modèle résident de `version`, sans jamais attendre un chargement.
+
+        Si la version n'est pas résidente, son chargement est lancé en fond et
+        la version par défaut (ou à défaut n'importe quel modèle résident) est
+        renvoyée : comparer `handle.version` à la version demandée. Seul le tout
+        premier appel, sans aucun modèle résident, charge de façon synchrone.
+        Une version sans checkpoint dans `models_dir` est servie par la version
+        par défaut, sans chargement ni erreur mémorisée.
+        """
+        version = version or self.default_version
+        with self._lock:
+            handle = self._resident.get(version)
+            if handle is not None:
+                self._resident.move_to_end(version)
+                return handle
+        if version != self.default_version and version not in self.versions():
+            return self.get()
+        with self._lock:
+            fallback = self._resident.get(self.default_version) or next(reversed(self._resident.values()), None)
+
+        if fallback is None:
+            with self._cold_start_lock:
+                with self._lock:
+                    handle = self._resident.get(version)
+                if handle is None and self._backing_off(version):
+                    return None
+                return handle or self._load(version)
+        self.request_load(version)
+        return fallback
+
+    def request_load(self, version, preload=False):
+        """Planifie le chargement (ou rechargement) d'une version en arrière-plan.
+
+        Une version en échec n'est retentée qu'une fois son fichier modifié.
+        """
+        if self._backing_off(version):
+            return
+        with self._lock:
+            if version in self._pending:
+                return
+            self._pending.add(version)
+        self._loader.submit(self._load, version, preload)
+
+    def _load(self, version, preload=False):
+        """Charge et préchauffe `version`.
+
+        Un préchargement (`preload`) n'est publié que s'il tient dans les limites
+        sans évincer personne; sinon il est abandonné et noté dans `_declined`
+        jusqu'à ce que son fichier change.
+        """
+        signature = self._signature(version)
+        try:
+            path = self.versions().get(version)
+            if path is None:
+                raise FileNotFoundError(f"Checkpoint introuvable pour la version {version}")
+            signature = file_signature(path)
+            started = time.perf_counter()
+            model = load_yolo(path)
+            loaded = time.perf_counter()
+            warmup(model, self.warmup_imgsz)
+            handle = ModelHandle(
+                version, path, model,
+                BatchScheduler(model, max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_ms),
+                signature, estimate_memory_mb(model, path),
+            )
+            handle.timings = {
+                "load_s": round(loaded - started, 3),
+                "warmup_s": round(time.perf_counter() - loaded, 3),
+            }
+        except Exception as e:
+            with self._lock:
+                self._errors[version] = str(e)
+                self._failed[version] = signature
+                self._pending.discard(version)
+            return None
+
+        with self._lock:
+            self._pending.discard(version)
+            previous = self._resident.get(version)
+            if preload and previous is None and not self._fits(handle.memory_mb):
+                self._declined[version] = signature
+                retired = [handle]
+            else:
+                # Bascule atomique : les nouvelles requêtes voient le modèle préchauffé
+                self._resident[version] = handle
+                self._resident.move_to_end(version)
+                self._errors.pop(version, None)
+                self._failed.pop(version, None)
+                self._declined.pop(version, None)
+                retired = [previous] if previous is not None else []
+                retired.extend(self._evict())
+        for old in retired:
+            # Les requêtes déjà en file sont traitées avant l'arrêt de l'ordonnanceur
+            threading.Thread(target=old.scheduler.close, daemon=True).start()
+        return None if retired and retired[0] is handle else handle
+
+    def _fits(self, memory_mb):
+        """Vrai si un modèle de plus (`memory_mb`) tient sans éviction (verrou tenu)"""
+        if len(self._resident) >= self.max_resident:
+            return False
+        if self.max_memory_mb is None:
+            return True
+        return sum(h.memory_mb for h in self._resident.values()) + memory_mb <= self.max_memory_mb
+
+    def _evict(self):
+        """Retire les modèles les moins récemment utilisés au-delà des limites (verrou tenu)"""
+        evicted = []
+
+        def over_limit():
+            if len(self._resident) > self.max_resident:
+                return True
+            if self.max_memory_mb is None:
+                return False
+            return sum(h.memory_mb for h in self._resident.values()) > self.max_memory_mb
+
+        for version in list(self._resident):
+            if not over_limit():
+                break
+            if version == self.default_version or len(self._resident) == 1:
+                continue
+            evicted.append(self._resident.pop(version))
+        return evicted
+
+    # ---------------------------------------
+    # 👀 SURVEILLANCE DU DOSSIER
+    # ---------------------------------------
+    def start(self):
+        """Lance la surveillance de `models_dir` (idempotent)"""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._loader.shutdown(wait=False)
+
+    def _may_fit(self, path):
+        """Estimation avant chargement (taille du checkpoint) de la place mémoire restante"""
+        if self.max_memory_mb is None:
+            return True
+        with self._lock:
+            used = sum(h.memory_mb for h in self._resident.values())
+        return used + os.path.getsize(path) / (1024 * 1024) <= self.max_memory_mb
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            available = self.versions()
+            with self._lock:
+                resident = {v: h.signature for v, h in self._resident.items()}
+                pending = set(self._pending)
+            room = self.max_resident - len(resident) - len(pending)
+            for version, path in available.items():
+                try:
+                    signature = file_signature(path)
+                except OSError:
+                    continue
+                changed = version in resident and resident[version] != signature
+                missing_default = version == self.default_version and version not in resident
+                if changed or missing_default:
+                    room -= missing_default and version not in pending
+                    self.request_load(version)
+                elif (version not in resident and version not in pending and room > 0
+                      and not self._backing_off(version) and self._declined.get(version) != signature
+                      and self._may_fit(path)):
+                    # Nouveau checkpoint : préchargé tant qu'il reste de la place parmi les résidents
+                    room -= 1
+                    self.request_load(version, preload=True)
+
+
+# ---------------------------------------
+# 🌍 REGISTRE PARTAGÉ DU PROCESSUS
+# ---------------------------------------
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def registry_from_env(**overrides):
+    """Registre configuré par MAX_RESIDENT_MODELS, MODEL_MEMORY_MB, INFER_MAX_BATCH, INFER_MAX_WAIT_MS"""
+    options = {
+        "max_resident": int(os.environ.get("MAX_RESIDENT_MODELS", "2")),
+        "max_memory_mb": float(os.environ["MODEL_MEMORY_MB"]) if os.environ.get("MODEL_MEMORY_MB") else None,
+        "max_batch_size": int(os.environ.get("INFER_MAX_BATCH", str(DEFAULT_BATCH_SIZE))),
+        "max_wait_ms": float(os.environ.get("INFER_MAX_WAIT_MS", "10")),
+    }
+    options.update(overrides)
+    return ModelRegistry(**options)
+
+
+def shared_registry():
+    """Registre unique du processus, créé au premier appel.
+
+    Un lanceur (startup.py) peut ainsi charger et préchauffer le modèle avant
+    que le serveur n'accepte la première session : l'application retrouve le
+    même registre, déjà chaud.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = registry_from_env()
+        return _shared
@@ -2,28 +2,44 @@
 import streamlit as st
 import os
 import numpy as np
-from PIL import Image
-import io
+import tempfile
+import time
+import threading
+
+from cascade import (
+    DEFAULT_ACCEPT_CONF, DEFAULT_CANDIDATE_CONF, DEFAULT_LOW_IMGSZ, CascadeConfig, cascade_mode,
+    cascade_predict_many, cascade_report,
+)
+from classifier import Classifier, classifier_available
+from detections import Detections
+from history import HOUR, store_from_env
+from inference import (
+    DEFAULT_CONF, DEFAULT_IMGSZ, DEFAULT_BATCH_SIZE,
+    check_decode_budget, decode_image, decode_many, decode_reduced, decoded_bytes, load_yolo, module_available,
+    split_by_budget,
+)
+from metrics import METRICS, start_metrics_server
+from model_info import model_metadata
+from model_registry import shared_registry
+from result_cache import (
+    DetectionCache, entry_from_result, hash_bytes, make_key, scale_entry,
+)
+from renderer import DISPLAY_MAX_SIDE, render_display, render_full
+from tiling import DEFAULT_OVERLAP, DEFAULT_TILE_SIZE, sliced_predict
 
 # Configuration pour éviter les problèmes OpenCV
 os.environ['OPENCV_IO_ENABLE_OPENEXR'] = '0'
 os.environ['OPENCV_VIDEOIO_PRIORITY_MSMF'] = '0'
 
-# Import sécurisé d'OpenCV
-try:
-    import cv2
-    CV2_AVAILABLE = True
-except ImportError as e:
-    st.error(f"❌ OpenCV non disponible: {e}")
-    CV2_AVAILABLE = False
-
-# Import sécurisé d'Ultralytics
-try:
-    from ultralytics import YOLO
-    ULTRALYTICS_AVAILABLE = True
-except ImportError as e:
-    st.error(f"❌ Ultralytics non disponible: {e}")
-    ULTRALYTICS_AVAILABLE = False
+# OpenCV et Ultralytics sont seulement détectés ici : leur import (plusieurs secondes
+# pour torch) est fait par les modules qui s'en servent, au premier besoin
+CV2_AVAILABLE = module_available("cv2")
+if not CV2_AVAILABLE:
+    st.error("❌ OpenCV non disponible")
+
+ULTRALYTICS_AVAILABLE = module_available("ultralytics")
+if not ULTRALYTICS_AVAILABLE:
+    st.error("❌ Ultralytics non disponible")
 
 # ---------------------------------------
 # 🎨 CONFIG INTERFACE MODERNE
@@ -269,28 +285,147 @@ st.markdown(custom_css, unsafe_allow_html=True)
 # ---------------------------------------
 # 🧠 CHARGEMENT DU MODEL YOLO
 # ---------------------------------------
-MODEL_PATH = "models/best.pt"
-
 def ensure_models_directory():
     """Crée le dossier models s'il n'existe pas"""
     os.makedirs("models", exist_ok=True)
     return os.path.exists("models")
 
 @st.cache_resource
-def load_model(path=MODEL_PATH):
-    if not os.path.exists(path):
-        return None
+def get_registry():
+    """Registre partagé : surveille models/ et recharge les checkpoints à chaud.
+
+    Lancée via `python startup.py`, l'application retrouve le registre déjà
+    chargé et préchauffé avant l'ouverture du serveur.
+    """
+    return shared_registry().start()
+
+def load_model(version=None):
+    """Modèle résident de la version demandée (ou celui qui la remplace pendant son chargement)"""
     try:
-        model = YOLO(path)
-        st.success("✅ Modèle YOLO chargé avec succès!")
-        return model
+        return registry.get(version)
     except Exception as e:
         st.error(f"❌ Erreur lors du chargement du modèle : {str(e)}")
         return None
 
+@st.cache_resource
+def get_classifier():
+    """Classifieur du 2ᵉ étage (saved_models/), chargé et préchauffé une fois par processus"""
+    return Classifier()
+
 # Initialisation
 ensure_models_directory()
-model = load_model() if ULTRALYTICS_AVAILABLE else None
+registry = get_registry() if ULTRALYTICS_AVAILABLE else None
+model_versions = list(registry.versions()) if registry else []
+selected_version = st.session_state.get("model_version") or (model_versions[0] if model_versions else None)
+model_handle = load_model(selected_version) if model_versions else None
+model = model_handle.model if model_handle else None
+scheduler = model_handle.scheduler if model_handle else None
+
+# Pool multi-processus optionnel (INFERENCE_REPLICAS > 0) : une réplique du modèle
+# par groupe de cœurs, à la place de l'ordonnanceur en processus. Il ne sert que la
+# version par défaut; les autres versions passent par leur ordonnanceur.
+INFERENCE_REPLICAS = int(os.environ.get("INFERENCE_REPLICAS", "0"))
+
+@st.cache_resource
+def get_pool_holder():
+    return {"lock": threading.Lock(), "fingerprint": None, "pool": None, "building": None, "error": None}
+
+def _build_pool(holder, path, fingerprint):
+    """Démarre les workers hors du verrou; l'ancien pool sert jusqu'à ce que le nouveau soit prêt"""
+    from worker_pool import InferencePool
+    try:
+        pool = InferencePool(path, replicas=INFERENCE_REPLICAS)
+    except Exception as e:
+        with holder["lock"]:
+            holder["building"] = None
+            holder["error"] = (fingerprint, str(e))
+        return
+    with holder["lock"]:
+        previous = holder["pool"]
+        holder.update(pool=pool, fingerprint=fingerprint, building=None, error=None)
+    if previous is not None:
+        # Les lots déjà en file sont traités avant l'arrêt des workers
+        previous.close()
+
+def get_inference_pool(handle):
+    """Pool des répliques pour le checkpoint par défaut, ou None (repli sur l'ordonnanceur).
+
+    Le pool est (re)construit en arrière-plan quand le checkpoint change ou
+    qu'un worker est mort : aucune session n'attend le chargement des répliques.
+    """
+    if not INFERENCE_REPLICAS or handle is None or handle.version != registry.default_version:
+        return None
+    holder = get_pool_holder()
+    with holder["lock"]:
+        pool = holder["pool"]
+        current = pool is not None and pool.alive and holder["fingerprint"] == handle.fingerprint
+        failed = holder["error"] is not None and holder["error"][0] == handle.fingerprint
+        if not current and holder["building"] is None and not failed:
+            holder["building"] = handle.fingerprint
+            threading.Thread(target=_build_pool, args=(holder, handle.path, handle.fingerprint),
+                             name="inference-pool-build", daemon=True).start()
+        if failed:
+            st.warning(f"⚠️ Pool d'inférence indisponible, repli sur le modèle local : {holder['error'][1]}")
+        return pool if current else None
+
+inference_pool = get_inference_pool(model_handle)
+
+# ---------------------------------------
+# ⚡ CACHE DES RÉSULTATS
+# ---------------------------------------
+@st.cache_resource
+def get_detection_cache():
+    """Cache partagé entre sessions; persistant si DETECTION_CACHE_DIR est défini"""
+    return DetectionCache(
+        max_entries=int(os.environ.get("DETECTION_CACHE_SIZE", "256")),
+        persist_dir=os.environ.get("DETECTION_CACHE_DIR") or None
+    )
+
+def detection_cache_key(image_hash, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ, mode=""):
+    """Clé de cache d'une image (empreinte hash_bytes) pour le modèle courant (None si modèle absent)"""
+    if model_handle is None:
+        return None
+    return make_key(image_hash, model_handle.fingerprint, conf, imgsz, mode)
+
+detection_cache = get_detection_cache()
+
+# ---------------------------------------
+# 🗄️ HISTORIQUE DES DÉTECTIONS
+# ---------------------------------------
+@st.cache_resource
+def get_history_store():
+    """Historique SQLite partagé (DETECTION_HISTORY_DB), écrit par un thread de fond"""
+    return store_from_env()
+
+history_store = get_history_store()
+
+# ---------------------------------------
+# 🧮 DÉCODAGE ET BUDGET MÉMOIRE
+# ---------------------------------------
+# Les uploads sont décodés directement à la taille d'affichage, qui couvre aussi
+# l'inférence (YOLO réduit à DEFAULT_IMGSZ de toute façon)
+DECODE_TARGET = max(DISPLAY_MAX_SIDE, DEFAULT_IMGSZ)
+# Octets de pixels décodés simultanément par une session (lots, pleine résolution)
+SESSION_MEMORY_BYTES = int(float(os.environ.get("SESSION_MEMORY_MB", "512")) * 1024 * 1024)
+
+def decode_full(data):
+    """Décodage pleine résolution, refusé au-delà du budget mémoire de la session"""
+    check_decode_budget(decoded_bytes(data), SESSION_MEMORY_BYTES)
+    return decode_image(data)
+
+# ---------------------------------------
+# ⏱️ INSTRUMENTATION
+# ---------------------------------------
+# Panneau de temps par étape (POUBELLE_DEBUG=1) et export Prometheus (METRICS_PORT)
+DEBUG_PANEL = os.environ.get("POUBELLE_DEBUG", "0") == "1"
+
+@st.cache_resource
+def get_metrics_server(port):
+    """Démarre l'exposition /metrics une seule fois par processus"""
+    return start_metrics_server(port)
+
+if os.environ.get("METRICS_PORT"):
+    get_metrics_server(int(os.environ["METRICS_PORT"]))
 
 # ---------------------------------------
 # 🖥️ HEADER PRINCIPAL
@@ -333,6 +468,16 @@ if model is None:
     """)
 else:
     st.success("✅ **Modèle chargé avec succès!**")
+
+    # Choix de la version (un fichier .pt dans models/ = une version)
+    st.selectbox(
+        "🧬 Version du modèle",
+        model_versions,
+        key="model_version",
+        help="Les nouveaux checkpoints déposés dans models/ sont détectés et chargés à chaud"
+    )
+    if model_handle.version != selected_version:
+        st.info(f"⏳ Chargement de `{selected_version}` en arrière-plan — `{model_handle.version}` est utilisé en attendant")
     
     # Informations sur le modèle
     col_info, col_download = st.columns([2, 1])
@@ -344,35 +489,43 @@ else:
         - **Fonction**: Détection de poubelles
         - **Statut**: ✅ Opérationnel
         """)
+        st.markdown(f"- **Version**: `{model_handle.version}`")
+        st.markdown(f"- **Backend**: `{model_handle.backend}`")
         
+        # Métadonnées calculées une fois, recalculées seulement si le checkpoint change
+        model_meta = model_metadata(model_handle.path, getattr(model, "names", None)) if os.path.exists(model_handle.path) else None
+
         # Affichage des classes détectables
-        if hasattr(model, 'names'):
+        if model_meta and model_meta["class_names"]:
             st.markdown("### 🏷️ Classes Détectables")
-            classes = list(model.names.values())
-            classes_text = ", ".join(classes)
+            classes_text = ", ".join(model_meta["class_names"])
             st.markdown(f"**Objets reconnus:** {classes_text}")
     
     with col_download:
         st.markdown("### 📥 Téléchargement")
         
         # Bouton de téléchargement du modèle actuel
-        if os.path.exists(MODEL_PATH):
-            with open(MODEL_PATH, "rb") as f:
-                model_data = f.read()
-            
-            st.download_button(
-                label="💾 Télécharger le Modèle",
-                data=model_data,
-                file_name="best.pt",
-                mime="application/octet-stream",
-                help="Téléchargez le modèle YOLO de détection de poubelles",
-                use_container_width=True,
-                key="download_model"
-            )
+        if model_meta:
+            # Le fichier n'est lu qu'à la demande, pas à chaque rerun
+            if st.session_state.get("model_download_ready"):
+                with open(model_handle.path, "rb") as f:
+                    st.download_button(
+                        label="💾 Télécharger le Modèle",
+                        data=f,
+                        file_name=os.path.basename(model_handle.path),
+                        mime="application/octet-stream",
+                        help="Téléchargez le modèle YOLO de détection de poubelles",
+                        use_container_width=True,
+                        key="download_model",
+                        on_click=lambda: st.session_state.update(model_download_ready=False)
+                    )
+            elif st.button("📦 Préparer le téléchargement", use_container_width=True, key="prepare_download"):
+                st.session_state["model_download_ready"] = True
+                st.rerun()
             
             # Informations sur le modèle
-            file_size = len(model_data) / (1024 * 1024)  # Taille en MB
-            st.info(f"**Taille du modèle:** {file_size:.1f} MB")
+            st.info(f"**Taille du modèle:** {model_meta['size_mb']:.1f} MB")
+            st.caption(f"SHA-256 `{model_meta['sha256'][:12]}` · modifié le {model_meta['modified']}")
         
         st.markdown("---")
         st.markdown("### 🔗 Modèles Pré-entraînés")
@@ -382,6 +535,19 @@ else:
         - [YOLOv8s](https://github.com/ultralytics/assets/releases/download/v0.0.0/yolov8s.pt)
         - [YOLOv8m](https://github.com/ultralytics/assets/releases/download/v0.0.0/yolov8m.pt)
         """)
+
+    # Modèles résidents, chargements en cours et erreurs du registre
+    with st.expander("🗂️ Registre des modèles"):
+        st.json(registry.status())
+
+    # Statistiques de l'ordonnanceur, pour régler INFER_MAX_WAIT_MS
+    with st.expander("📈 Ordonnanceur d'inférence"):
+        sched_stats = scheduler.stats()
+        col_q, col_b, col_w = st.columns(3)
+        col_q.metric("File d'attente", sched_stats["queue_depth"])
+        col_b.metric("Taille moyenne des lots", f"{sched_stats['mean_batch_size']:.2f}")
+        col_w.metric("Attente moyenne", f"{sched_stats['mean_wait_ms']:.1f} ms")
+        st.json(sched_stats)
     
 st.markdown("</div>", unsafe_allow_html=True)
 
@@ -397,19 +563,365 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-uploaded_img = st.file_uploader(
-    " ",
-    type=["jpg", "jpeg", "png"],
-    key="main_uploader",
-    label_visibility="collapsed"
+SINGLE_MODE = "🖼️ Image unique"
+BATCH_MODE = "📚 Lot d'images"
+VIDEO_MODE = "🎥 Vidéo / Flux"
+BATCH_PAGE_SIZE = 6
+
+analysis_mode = st.radio(
+    "Mode d'analyse",
+    [SINGLE_MODE, BATCH_MODE, VIDEO_MODE],
+    horizontal=True,
+    key="analysis_mode"
 )
 
+uploaded_img = None
+uploaded_batch = []
+uploaded_video = None
+stream_url = ""
+if analysis_mode == VIDEO_MODE:
+    uploaded_video = st.file_uploader(
+        " ",
+        type=["mp4", "avi", "mov", "mkv"],
+        key="video_uploader",
+        label_visibility="collapsed"
+    )
+    stream_url = st.text_input(
+        "...ou URL d'un flux caméra",
+        placeholder="rtsp://192.168.1.10:554/stream",
+        key="stream_url"
+    ).strip()
+elif analysis_mode == BATCH_MODE:
+    uploaded_batch = st.file_uploader(
+        " ",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
+        key="batch_uploader",
+        label_visibility="collapsed"
+    ) or []
+else:
+    uploaded_img = st.file_uploader(
+        " ",
+        type=["jpg", "jpeg", "png"],
+        key="main_uploader",
+        label_visibility="collapsed"
+    )
+
 st.markdown("</div>", unsafe_allow_html=True)
 
+# Cascade : passe rapide à basse résolution, reprise à DEFAULT_IMGSZ (ou par tuiles
+# sur les zones incertaines) seulement quand les scores ne sont pas concluants
+CASCADE_REFINE_LABELS = {"full": f"Image entière à {DEFAULT_IMGSZ}", "tiles": "Tuiles des zones incertaines"}
+CASCADE_STAGE_LABELS = {
+    "low": "⚡ Cascade : accepté dès la passe rapide",
+    "full": f"🔁 Cascade : repris à {DEFAULT_IMGSZ}",
+    "tiles": "🧩 Cascade : zones incertaines reprises par tuiles",
+}
+# Caméra ou emplacement associé aux analyses dans l'historique
+camera_name = ""
+if history_store is not None and analysis_mode != VIDEO_MODE:
+    camera_name = st.text_input(
+        "📷 Caméra / emplacement (historique)", placeholder="ex. parking-nord", key="camera_name"
+    ).strip()
+
+cascade_config = None
+predict_many = inference_pool.map if inference_pool is not None else (scheduler.predict_many if scheduler else None)
+if analysis_mode != VIDEO_MODE:
+    with st.expander("⚡ Inférence en cascade"):
+        if st.checkbox("Passe rapide à basse résolution, affinage seulement si incertain", key="use_cascade"):
+            col_low, col_accept, col_candidate, col_refine = st.columns(4)
+            cascade_config = CascadeConfig(
+                low_imgsz=col_low.select_slider(
+                    "Résolution rapide", options=[256, 320, 416, 480], value=DEFAULT_LOW_IMGSZ, key="cascade_low"
+                ),
+                accept_conf=col_accept.slider(
+                    "Seuil d'acceptation", min_value=0.3, max_value=0.95, value=DEFAULT_ACCEPT_CONF, step=0.05,
+                    key="cascade_accept"
+                ),
+                candidate_conf=col_candidate.slider(
+                    "Seuil des candidats", min_value=0.05, max_value=0.5, value=DEFAULT_CANDIDATE_CONF, step=0.05,
+                    key="cascade_candidate"
+                ),
+                refine=col_refine.radio(
+                    "Affinage", list(CASCADE_REFINE_LABELS), format_func=CASCADE_REFINE_LABELS.get,
+                    key="cascade_refine"
+                ),
+            )
+        # Taux de sortie anticipée depuis le démarrage, pour régler les seuils
+        cascade_stats = cascade_report(METRICS.summary()["counters"])
+        if cascade_stats["images"]:
+            col_images, col_early, col_refined = st.columns(3)
+            col_images.metric("Images en cascade", cascade_stats["images"])
+            col_early.metric("Sorties anticipées", f"{cascade_stats['early_exit_rate']:.0%}")
+            col_refined.metric("Reprises", cascade_stats["refined_full"] + cascade_stats["refined_tiles"])
+
 # ---------------------------------------
 # 🖼️ AFFICHAGE DES RÉSULTATS
 # ---------------------------------------
-if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
+def render_preview(image_rgb, entry, scale=1.0):
+    """Ajoute à l'entrée son aperçu annoté (réduit, encodé une seule fois).
+
+    `scale` est le rapport image d'origine / `image_rgb` : les boîtes de
+    l'entrée sont exprimées dans le repère d'origine.
+    """
+    with METRICS.stage("render"):
+        entry["preview"] = render_display(image_rgb, entry, model.names, in_place=True, box_scale=1.0 / scale)
+    return entry
+
+
+if (uploaded_video or stream_url) and ULTRALYTICS_AVAILABLE and model is not None and CV2_AVAILABLE:
+    from video import DEFAULT_DETECT_EVERY, process_video
+
+    st.markdown("<div class='content-card'>", unsafe_allow_html=True)
+    st.markdown("### 🎥 Analyse Vidéo")
+
+    col_every, col_max = st.columns(2)
+    detect_every = col_every.slider(
+        "Détecter une image sur N",
+        min_value=1, max_value=15, value=DEFAULT_DETECT_EVERY,
+        key="video_every"
+    )
+    max_frames = col_max.number_input(
+        "Nombre max. d'images (0 = toutes)",
+        min_value=0, value=0 if uploaded_video else 900, step=100,
+        key="video_max_frames"
+    )
+
+    if st.button("🎬 Lancer l'Analyse Vidéo", type="primary", use_container_width=True):
+        source = stream_url
+        tmp_path = None
+        if uploaded_video:
+            # OpenCV lit un chemin : la vidéo uploadée passe par un fichier temporaire
+            suffix = os.path.splitext(uploaded_video.name)[1] or ".mp4"
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                tmp.write(uploaded_video.getvalue())
+                tmp_path = source = tmp.name
+
+        preview = st.empty()
+
+        def show_frame(index, frame, result, detected):
+            if detected and result is not None and (index // detect_every) % 5 == 0:
+                preview.image(
+                    render_display(frame, entry_from_result(result), model.names, bgr=True),
+                    caption=f"Image #{index}",
+                    use_container_width=True
+                )
+
+        summary = None
+        with st.spinner("🔍 **Analyse vidéo en cours...**"):
+            try:
+                # Modèle dédié : l'état du tracker ne doit pas être partagé entre sessions
+                summary = process_video(
+                    load_yolo(model_handle.path),
+                    source,
+                    detect_every=detect_every,
+                    max_frames=int(max_frames) or None,
+                    on_frame=show_frame
+                )
+            except Exception as e:
+                st.error(f"❌ Erreur d'analyse vidéo: {e}")
+            finally:
+                if tmp_path:
+                    os.remove(tmp_path)
+
+        if summary:
+            col_f, col_d, col_t = st.columns(3)
+            col_f.metric("Images lues", summary["frames"])
+            col_d.metric("Images analysées", summary["detected_frames"])
+            col_t.metric("Débit", f"{summary['throughput_fps']:.1f} img/s")
+            if summary["dropped_frames"]:
+                st.warning(f"⚠️ {summary['dropped_frames']} images ignorées pour tenir le temps réel")
+
+            st.markdown("### 🕒 Chronologie des Poubelles")
+            if summary["timeline"]:
+                st.dataframe(summary["timeline"], use_container_width=True, hide_index=True)
+            else:
+                st.warning("❌ Aucune poubelle suivie dans la vidéo")
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+elif (uploaded_video or stream_url) and not CV2_AVAILABLE:
+    st.error("❌ OpenCV non disponible - Impossible de lire la vidéo")
+
+elif (uploaded_video or stream_url) and (not ULTRALYTICS_AVAILABLE or model is None):
+    st.error("❌ Modèle non disponible - Impossible d'analyser la vidéo")
+
+elif uploaded_batch and ULTRALYTICS_AVAILABLE and model is not None:
+    st.markdown("<div class='content-card'>", unsafe_allow_html=True)
+    st.markdown(f"### 📚 Lot de {len(uploaded_batch)} image(s)")
+
+    batch_size = st.slider(
+        "Taille des lots d'inférence",
+        min_value=1, max_value=32, value=DEFAULT_BATCH_SIZE,
+        key="batch_size"
+    )
+    analyze_batch = st.button(
+        "🚀 Analyser le Lot",
+        type="primary",
+        use_container_width=True
+    )
+
+    if analyze_batch:
+        with st.spinner(f"🔍 **Analyse de {len(uploaded_batch)} images en cours...**"):
+            names = [f.name for f in uploaded_batch]
+            blobs = [f.getvalue() for f in uploaded_batch]
+
+            # Les images déjà analysées sont servies par le cache
+            batch_mode = cascade_mode(cascade_config) if cascade_config else ""
+            hashes = [hash_bytes(b) for b in blobs]
+            keys = [detection_cache_key(h, mode=batch_mode) for h in hashes]
+            cached = [detection_cache.get(k) if k else None for k in keys]
+            pending = [i for i, e in enumerate(cached) if e is None]
+
+            METRICS.inc("analyses", len(blobs))
+            METRICS.inc("cache_hits", len(blobs) - len(pending))
+            METRICS.inc("cache_misses", len(pending))
+
+            # Décodage réduit, par groupes tenant dans le budget mémoire de la session :
+            # les tableaux d'un groupe sont libérés avant de décoder le suivant
+            errors = {}
+            sizes = []
+            for i in pending:
+                try:
+                    sizes.append(decoded_bytes(blobs[i], DECODE_TARGET))
+                except Exception as e:
+                    errors[i] = str(e)
+                    sizes.append(0)
+            for group in split_by_budget(sizes, SESSION_MEMORY_BYTES):
+                if len(group) == 1 and sizes[group[0]] > SESSION_MEMORY_BYTES:
+                    errors[pending[group[0]]] = "Image trop grande pour le budget mémoire de la session"
+                    continue
+                group = [pending[k] for k in group if pending[k] not in errors]
+                with METRICS.stage("batch_decode"):
+                    decoded = dict(zip(group, decode_many([blobs[i] for i in group], target=DECODE_TARGET)))
+                errors.update({i: d[1] for i, d in decoded.items() if d[0] is None})
+                valid = [i for i in group if decoded[i][0] is not None]
+
+                try:
+                    with METRICS.stage("batch_predict"):
+                        if cascade_config is not None:
+                            pool_entries = cascade_predict_many(
+                                predict_many,
+                                [decoded[i][0] for i in valid],
+                                cascade_config,
+                                conf=DEFAULT_CONF,
+                                batch_size=batch_size
+                            )
+                            results = []
+                        elif inference_pool is not None:
+                            pool_entries = inference_pool.map(
+                                [decoded[i][0] for i in valid],
+                                conf=DEFAULT_CONF,
+                                imgsz=DEFAULT_IMGSZ,
+                                batch_size=batch_size
+                            )
+                            results = []
+                        else:
+                            pool_entries = []
+                            results = scheduler.predict_many(
+                                [decoded[i][0] for i in valid],
+                                conf=DEFAULT_CONF,
+                                imgsz=DEFAULT_IMGSZ,
+                                batch_size=batch_size
+                            )
+                except Exception as e:
+                    st.error(f"❌ Erreur d'analyse: {e}")
+                    pool_entries, results = [], []
+
+                for i, entry in zip(valid, pool_entries):
+                    cached[i] = entry
+                for i, r in zip(valid, results):
+                    cached[i] = entry_from_result(r)
+                for i in valid:
+                    if cached[i] is None:
+                        continue
+                    array, _, scale = decoded[i]
+                    render_preview(array, scale_entry(cached[i], scale), scale)
+                    if keys[i]:
+                        detection_cache.put(keys[i], cached[i])
+                decoded = None
+
+            entries = []
+            for i, (name, entry) in enumerate(zip(names, cached)):
+                if entry is None:
+                    entries.append({"name": name, "image": None, "detections": Detections.empty(),
+                                    "error": errors.get(i)})
+                    continue
+                if not entry.get("preview"):
+                    try:
+                        array, scale = decode_reduced(blobs[i], DECODE_TARGET, max_bytes=SESSION_MEMORY_BYTES)
+                    except MemoryError as e:
+                        # Détections conservées (cache), seul l'aperçu est refusé
+                        entries.append({"name": name, "image": None,
+                                        "detections": Detections.from_entry(entry, model.names), "error": str(e)})
+                        continue
+                    render_preview(array, entry, scale)
+                entries.append({
+                    "name": name,
+                    "image": entry["preview"],
+                    "detections": Detections.from_entry(entry, model.names),
+                    "error": None,
+                })
+            if history_store is not None:
+                for image_hash, entry in zip(hashes, cached):
+                    if entry is not None:
+                        history_store.record(image_hash, entry, camera_name, model.names)
+            st.session_state["batch_results"] = entries
+            st.session_state["batch_page"] = 1
+
+    entries = st.session_state.get("batch_results")
+    if entries:
+        # Tableau récapitulatif par image
+        st.markdown("### 🧾 Récapitulatif")
+        summary = []
+        for entry in entries:
+            dets = entry["detections"]
+            summary.append({
+                "Fichier": entry["name"],
+                "Détections": len(dets),
+                "Classes": ", ".join(f"{k} ×{v}" for k, v in dets.counts().items()) or "-",
+                "Confiance max": f"{dets.conf.max() * 100:.0f}%" if len(dets) else "-",
+                "Erreur": entry["error"] or "",
+            })
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+
+        # Totaux par classe sur tout le lot
+        all_dets = Detections(
+            np.concatenate([e["detections"].xyxy for e in entries]),
+            np.concatenate([e["detections"].cls for e in entries]),
+            np.concatenate([e["detections"].conf for e in entries]),
+            model.names
+        )
+        if len(all_dets):
+            st.markdown("#### 📊 Totaux par classe")
+            st.dataframe(all_dets.summary(), use_container_width=True, hide_index=True)
+
+        # Grille paginée des images annotées
+        n_pages = (len(entries) + BATCH_PAGE_SIZE - 1) // BATCH_PAGE_SIZE
+        page = st.number_input(
+            f"Page (sur {n_pages})",
+            min_value=1, max_value=n_pages, step=1,
+            key="batch_page"
+        )
+        page_entries = entries[(page - 1) * BATCH_PAGE_SIZE:page * BATCH_PAGE_SIZE]
+        grid = st.columns(3)
+        for k, entry in enumerate(page_entries):
+            with grid[k % 3]:
+                if entry["image"] is not None:
+                    st.image(
+                        entry["image"],
+                        caption=f"{entry['name']} · {len(entry['detections'])} détection(s)",
+                        use_container_width=True
+                    )
+                else:
+                    st.error(f"❌ {entry['name']}: {entry['error'] or 'non analysée'}")
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+elif uploaded_batch and (not ULTRALYTICS_AVAILABLE or model is None):
+    st.error("❌ Modèle non disponible - Impossible d'analyser les images")
+
+elif uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
     # Layout principal pour images
     col1, col2 = st.columns([1, 1])
     
@@ -417,13 +929,52 @@ if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
         st.markdown("<div class='content-card'>", unsafe_allow_html=True)
         st.markdown("### 🖼️ Image Originale")
         try:
-            image = Image.open(uploaded_img).convert("RGB")
-            st.image(image, caption="Image source uploadée", use_container_width=True)
+            # Décodage réduit (draft JPEG + orientation EXIF) : la pleine résolution
+            # n'est décodée que pour les tuiles ou le téléchargement
+            with METRICS.stage("decode"):
+                img_array, img_scale = decode_reduced(uploaded_img.getvalue(), DECODE_TARGET,
+                                                      max_bytes=SESSION_MEMORY_BYTES)
+            st.image(img_array, caption="Image source uploadée", use_container_width=True)
         except Exception as e:
             st.error(f"❌ Erreur de chargement: {e}")
             uploaded_img = None
         st.markdown("</div>", unsafe_allow_html=True)
 
+    # Découpage en tuiles pour les photos haute résolution (petites poubelles lointaines)
+    with st.expander("🧩 Inférence par tuiles (grandes images)"):
+        use_tiles = st.checkbox("Activer le découpage en tuiles", key="use_tiles")
+        col_tile, col_overlap, col_tile_batch = st.columns(3)
+        tile_size = col_tile.select_slider(
+            "Taille des tuiles", options=[320, 480, 640, 960], value=DEFAULT_TILE_SIZE, key="tile_size"
+        )
+        tile_overlap = col_overlap.slider(
+            "Recouvrement", min_value=0.0, max_value=0.5, value=DEFAULT_OVERLAP, step=0.05, key="tile_overlap"
+        )
+        tile_batch = col_tile_batch.slider(
+            "Tuiles par lot", min_value=1, max_value=32, value=DEFAULT_BATCH_SIZE, key="tile_batch"
+        )
+    tile_mode = f"tiles:{tile_size}:{tile_overlap:.2f}" if use_tiles else ""
+    if cascade_config is not None and not use_tiles:
+        tile_mode = cascade_mode(cascade_config)
+
+    # 2ᵉ étage optionnel : chaque boîte est reclassée par un classifieur Keras
+    classifier = None
+    if classifier_available():
+        with st.expander("🔬 Classification fine des objets (2ᵉ étage)"):
+            if st.checkbox("Classer chaque détection avec le classifieur 224×224", key="use_classifier"):
+                try:
+                    classifier = get_classifier()
+                except Exception as e:
+                    st.error(f"❌ Classifieur indisponible : {e}")
+            if classifier is not None:
+                accuracy = f" ({classifier.accuracy:.1%} en validation)" if classifier.accuracy is not None else ""
+                st.caption(f"Modèle `{classifier.name}`{accuracy} · chargé en {classifier.load_seconds:.2f}s")
+                if classifier.fallback:
+                    st.warning(f"⚠️ `{classifier.best}`, le mieux noté de metadata.json, est absent de "
+                               f"saved_models/ : repli sur `{classifier.name}`")
+    if classifier is not None:
+        tile_mode += f"|classifier:{classifier.name}"
+
     # Bouton d'analyse centré
     st.markdown("<div style='text-align: center; margin: 2rem 0;'>", unsafe_allow_html=True)
     analyze = st.button(
@@ -433,50 +984,131 @@ if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
     )
     st.markdown("</div>", unsafe_allow_html=True)
     
-    if analyze:
+    # Le dernier résultat reste affiché après un rerun (ex. téléchargement pleine résolution)
+    image_hash = hash_bytes(uploaded_img.getvalue()) if uploaded_img else None
+    cache_key = detection_cache_key(image_hash, mode=tile_mode) if uploaded_img else None
+    redisplay = cache_key is not None and st.session_state.get("last_analysis") == cache_key
+
+    if (analyze or redisplay) and uploaded_img:
         with st.spinner("🔍 **Analyse en cours...** L'IA scanne l'image"):
-            # Conversion et prédiction
-            img_array = np.array(image)
-            
-            try:
-                results = model.predict(img_array, conf=0.25, imgsz=640)
-            except Exception as e:
-                st.error(f"❌ Erreur d'analyse: {e}")
-                results = None
+            with METRICS.stage("cache_lookup"):
+                entry = detection_cache.get(cache_key) if cache_key else None
+            from_cache = entry is not None and analyze
+            if analyze:
+                METRICS.inc("analyses")
+                METRICS.inc("cache_hits" if from_cache else "cache_misses")
+
+            if entry is None:
+                try:
+                    if use_tiles:
+                        with METRICS.stage("decode_full"):
+                            full_array = decode_full(uploaded_img.getvalue())
+                        with METRICS.stage("predict_tiled"):
+                            entry = sliced_predict(
+                                scheduler.predict_many,
+                                full_array,
+                                tile_size=tile_size,
+                                overlap=tile_overlap,
+                                conf=DEFAULT_CONF,
+                                batch_size=tile_batch
+                            )
+                        full_array = None
+                        results = None
+                    elif cascade_config is not None:
+                        with METRICS.stage("predict_cascade"):
+                            entry = scale_entry(
+                                cascade_predict_many(predict_many, [img_array], cascade_config, conf=DEFAULT_CONF)[0],
+                                img_scale
+                            )
+                        results = None
+                    elif inference_pool is not None:
+                        with METRICS.stage("predict"):
+                            entry = scale_entry(
+                                inference_pool.predict(img_array, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ), img_scale
+                            )
+                        results = None
+                    else:
+                        with METRICS.stage("predict"):
+                            results = [scheduler.predict(img_array, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ)]
+                except Exception as e:
+                    METRICS.inc("errors")
+                    st.error(f"❌ Erreur d'analyse: {e}")
+                    results = None
 
-            if results and len(results) > 0:
-                r = results[0]
+                if entry is None and results:
+                    entry = scale_entry(entry_from_result(results[0]), img_scale)
+                if entry is not None and classifier is not None:
+                    # Avant le rendu, qui dessine dans img_array
+                    try:
+                        with METRICS.stage("classify"):
+                            second = classifier.classify(img_array, entry["boxes"], box_scale=1.0 / img_scale)
+                        entry.update(subclasses=second["labels"], subscores=second["scores"],
+                                     classify_ms=second["crop_ms"] + second["classify_ms"])
+                    except Exception as e:
+                        METRICS.inc("errors")
+                        st.warning(f"⚠️ Classification fine impossible : {e}")
+                if entry is not None:
+                    render_preview(img_array, entry, img_scale)
+                    with METRICS.stage("cache_store"):
+                        if cache_key:
+                            detection_cache.put(cache_key, entry)
+            elif not entry.get("preview"):
+                render_preview(img_array, entry, img_scale)
 
+            if entry is not None:
+                if analyze and history_store is not None:
+                    history_store.record(image_hash, entry, camera_name, model.names)
+                st.session_state["last_analysis"] = cache_key
                 # Affichage résultats dans colonne 2
                 with col2:
                     st.markdown("<div class='content-card'>", unsafe_allow_html=True)
                     st.markdown("### 📊 Résultats de Détection")
-                    
-                    if CV2_AVAILABLE:
+
+                    # Aperçu réduit; la version pleine résolution n'est dessinée qu'à la demande
+                    st.image(entry["preview"], caption="🟢 Détections YOLOv8", use_container_width=True)
+                    if st.session_state.get("full_res_ready") == cache_key:
                         try:
-                            # Tentative d'annotation avec OpenCV
-                            annotated = r.plot()
-                            annotated_rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
-                            st.image(annotated_rgb, caption="🟢 Détections YOLOv8", use_container_width=True)
-                        except Exception as e:
-                            st.warning("⚠️ Annotation OpenCV non disponible")
-                            st.image(image, caption="Image originale (annotation non disponible)", use_container_width=True)
-                    else:
-                        st.image(image, caption="Image originale (OpenCV non disponible)", use_container_width=True)
-                    
+                            full_png = render_full(decode_full(uploaded_img.getvalue()), entry, model.names,
+                                                   in_place=True)
+                        except MemoryError as e:
+                            st.warning(f"⚠️ {e}")
+                            full_png = None
+                    if st.session_state.get("full_res_ready") == cache_key and full_png is not None:
+                        st.download_button(
+                            label="💾 Télécharger en pleine résolution",
+                            data=full_png,
+                            file_name=f"{os.path.splitext(uploaded_img.name)[0]}_detections.png",
+                            mime="image/png",
+                            use_container_width=True,
+                            key="download_full_res",
+                            on_click=lambda: st.session_state.update(full_res_ready=None)
+                        )
+                    elif st.button("🖼️ Préparer l'image pleine résolution", use_container_width=True,
+                                   key="prepare_full_res"):
+                        st.session_state["full_res_ready"] = cache_key
+                        st.rerun()
+
+                    if from_cache:
+                        st.caption("⚡ Résultat servi depuis le cache")
+                    if entry.get("cascade"):
+                        st.caption(CASCADE_STAGE_LABELS[entry["cascade"]])
+                    if entry.get("tiles"):
+                        st.caption(f"🧩 {entry['tiles']} tuiles analysées")
+
                     st.markdown("</div>", unsafe_allow_html=True)
 
                 # Statistiques de détection
-                dets = getattr(r, "boxes", None)
-                if dets and len(dets) > 0:
+                dets = Detections.from_entry(entry, model.names)
+                n_dets = len(dets)
+                if n_dets > 0:
                     st.markdown("<div class='stats-container'>", unsafe_allow_html=True)
                     st.markdown(f"""
                     <div class="stat-item">
-                        <span class="stat-number">{len(dets)}</span>
+                        <span class="stat-number">{n_dets}</span>
                         <span class="stat-label">Poubelles Détectées</span>
                     </div>
                     <div class="stat-item">
-                        <span class="stat-number">{max(len(dets), 1)}</span>
+                        <span class="stat-number">{max(n_dets, 1)}</span>
                         <span class="stat-label">Analyses Effectuées</span>
                     </div>
                     <div class="stat-item">
@@ -486,31 +1118,43 @@ if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
                     """, unsafe_allow_html=True)
                     st.markdown("</div>", unsafe_allow_html=True)
 
-                    # Détails des détections
+                    # Détails des détections : un tableau agrégé et un graphique, pas un bloc par boîte
+                    METRICS.inc("detections", n_dets)
+                    render_started = time.perf_counter()
                     st.markdown("<div class='content-card'>", unsafe_allow_html=True)
                     st.markdown("### 🔍 Détails des Analyses")
-                    
-                    for i, box in enumerate(dets, start=1):
-                        cls_idx = int(box.cls[0])
-                        conf = float(box.conf[0])
-                        cls_name = model.names[cls_idx] if hasattr(model, "names") else str(cls_idx)
-                        
-                        # Affichage avec barre de confiance
-                        conf_percent = int(conf * 100)
-                        st.markdown(f"""
-                        <div class="confidence-bar-container">
-                            <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 10px;">
-                                <span class="detection-badge">🔍 Détection #{i} • {cls_name.upper()}</span>
-                                <strong style="font-size: 1.3rem; color: #e8f5e8;">{conf_percent}%</strong>
-                            </div>
-                            <div class="confidence-bar" style="width: {conf_percent}%;"></div>
-                            <div style="text-align: center; color: #c8e6c8; font-size: 0.9rem; margin-top: 5px;">
-                                Niveau de confiance de l'IA
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
+
+                    min_conf = st.slider(
+                        "Confiance minimale affichée",
+                        min_value=0.0, max_value=1.0, value=DEFAULT_CONF, step=0.05,
+                        key="min_conf"
+                    )
+                    shown = dets.filter(min_conf=min_conf)
+                    if len(shown):
+                        col_table, col_chart = st.columns([3, 2])
+                        class_rows = shown.summary()
+                        col_table.dataframe(class_rows, use_container_width=True, hide_index=True)
+                        col_chart.bar_chart(class_rows, x="Classe", y="Nombre")
+                        with st.expander(f"📋 Toutes les détections ({len(shown)})"):
+                            st.dataframe(shown.rows(), use_container_width=True, hide_index=True)
+                    else:
+                        st.info(f"Aucune détection au-dessus de {min_conf:.0%}")
+
+                    if entry.get("subclasses") is not None:
+                        st.markdown("#### 🔬 Classification fine")
+                        st.caption(f"⏱️ 2ᵉ étage : {entry['classify_ms']:.0f} ms pour {n_dets} objets "
+                                   f"(un seul lot){' · mesuré lors de la première analyse' if from_cache else ''}")
+                        kept = np.flatnonzero(dets.conf >= min_conf)
+                        labels = dets.labels
+                        st.dataframe(
+                            [{"Détection": labels[i], "Confiance YOLO": round(float(dets.conf[i]), 3),
+                              "Sous-classe": entry["subclasses"][i], "Confiance classifieur": entry["subscores"][i]}
+                             for i in kept],
+                            use_container_width=True, hide_index=True
+                        )
+
                     st.markdown("</div>", unsafe_allow_html=True)
+                    METRICS.observe("render_details", time.perf_counter() - render_started)
                 else:
                     st.warning("❌ Aucune poubelle détectée dans l'image")
             else:
@@ -555,6 +1199,45 @@ else:
     
     st.markdown("</div>", unsafe_allow_html=True)
 
+# ---------------------------------------
+# 🗄️ TABLEAU DE BORD DE L'HISTORIQUE
+# ---------------------------------------
+if history_store is not None:
+    with st.expander("🗄️ Historique des détections"):
+        # Lecture des agrégats horaires : quelques millisecondes quel que soit le volume
+        history_hours = st.select_slider("Période", options=[1, 6, 24, 24 * 7, 24 * 30], value=24,
+                                         format_func=lambda h: f"{h} h" if h < 48 else f"{h // 24} j",
+                                         key="history_hours")
+        history_since = time.time() - history_hours * HOUR
+        col_classes, col_cameras = st.columns(2)
+        col_classes.dataframe(
+            [{k: v for k, v in row.items() if k != "cls"} for row in history_store.class_counts(since=history_since)],
+            use_container_width=True, hide_index=True
+        )
+        col_cameras.dataframe(history_store.camera_counts(since=history_since), use_container_width=True,
+                              hide_index=True)
+        hourly = history_store.hourly_counts(since=history_since)
+        if hourly:
+            st.bar_chart(
+                [{"Heure": time.strftime("%d/%m %Hh", time.localtime(row["hour"])), "Détections": row["detections"]}
+                 for row in hourly],
+                x="Heure", y="Détections"
+            )
+        st.caption(f"Écriture : {history_store.stats()}")
+
+# ---------------------------------------
+# 🐞 PANNEAU DE DÉBOGAGE
+# ---------------------------------------
+if DEBUG_PANEL:
+    with st.expander("🐞 Temps par étape du pipeline"):
+        metrics_summary = METRICS.summary()
+        if metrics_summary["stages"]:
+            st.dataframe(metrics_summary["stages"], use_container_width=True, hide_index=True)
+        else:
+            st.info("Aucune mesure pour l'instant : lancez une analyse")
+        st.json(metrics_summary["counters"])
+        st.code(METRICS.render_prometheus(), language="text")
+
 # ---------------------------------------
 # 🏁 FOOTER
 # ---------------------------------------
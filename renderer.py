@@ -0,0 +1,116 @@
+# renderer.py
+# Rendu léger des détections : dessin direct sur le tampon RGB, réduit à la taille
+# d'affichage avant de dessiner, encodé une seule fois en JPEG/WebP.
+# La version pleine résolution n'est produite qu'à la demande (téléchargement).
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from inference import module_available
+
+# OpenCV est importé au premier rendu seulement (temps de démarrage)
+CV2_AVAILABLE = module_available("cv2")
+
+DISPLAY_MAX_SIDE = 1280
+DISPLAY_FORMAT = "JPEG"
+DISPLAY_QUALITY = 85
+
+# Palette RGB indexée par classe (vert de l'interface en premier)
+PALETTE = np.array([
+    (74, 176, 74), (255, 167, 38), (66, 165, 245), (239, 83, 80),
+    (171, 71, 188), (38, 198, 218), (255, 238, 88), (141, 110, 99),
+], dtype=np.uint8)
+TEXT_COLOR = (255, 255, 255)
+
+
+def _layout(entry, scale, height, width):
+    """Boîtes entières mises à l'échelle et couleurs, calculées en une passe NumPy"""
+    if not entry["boxes"]:
+        return np.zeros((0, 4), dtype=int), np.zeros((0, 3), dtype=np.uint8)
+    boxes = np.rint(np.asarray(entry["boxes"], dtype=np.float32) * scale).astype(int)
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width - 1)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height - 1)
+    colors = PALETTE[np.asarray(entry["classes"], dtype=int) % len(PALETTE)]
+    return boxes, colors
+
+
+def draw_detections(image, entry, names, scale=1.0, bgr=False):
+    """Dessine boîtes et étiquettes de `entry` sur `image` (modifiée en place).
+
+    `scale` convertit les coordonnées de l'entrée (image d'origine) vers `image`.
+    """
+    height, width = image.shape[:2]
+    boxes, colors = _layout(entry, scale, height, width)
+    if bgr:
+        colors = colors[:, ::-1]
+    thickness = max(2, round(max(height, width) / 500))
+    labels = [f"{names[c] if names else c} {s:.2f}" for c, s in zip(entry["classes"], entry["scores"])]
+
+    if CV2_AVAILABLE:
+        import cv2
+        font_scale = thickness / 4
+        for (x1, y1, x2, y2), color, label in zip(boxes.tolist(), colors.tolist(), labels):
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+            (tw, th), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+            top = max(y1 - th - baseline - 2, 0)
+            cv2.rectangle(image, (x1, top), (x1 + tw + 4, top + th + baseline + 2), color, -1)
+            cv2.putText(image, label, (x1 + 2, top + th + 1), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, TEXT_COLOR, 1, cv2.LINE_AA)
+        return image
+
+    # Repli PIL : une seule conversion aller-retour pour toute l'image
+    canvas = Image.fromarray(image)
+    draw = ImageDraw.Draw(canvas)
+    for (x1, y1, x2, y2), color, label in zip(boxes.tolist(), colors.tolist(), labels):
+        draw.rectangle((x1, y1, x2, y2), outline=tuple(color), width=thickness)
+        left, upper, right, lower = draw.textbbox((0, 0), label)
+        tw, th = right - left, lower - upper
+        top = max(y1 - th - 4, 0)
+        draw.rectangle((x1, top, x1 + tw + 4, top + th + 4), fill=tuple(color))
+        draw.text((x1 + 2, top + 2), label, fill=TEXT_COLOR)
+    image[...] = np.asarray(canvas)
+    return image
+
+
+def _downscale(image, max_side):
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale >= 1.0:
+        return None, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if CV2_AVAILABLE:
+        import cv2
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR, reducing_gap=2.0)).copy(), scale
+
+
+def encode(image, fmt=DISPLAY_FORMAT, quality=DISPLAY_QUALITY, bgr=False):
+    """Encode une image (RGB, ou BGR avec `bgr=True`) en octets du format demandé"""
+    buffer = io.BytesIO()
+    options = {"quality": quality} if fmt in ("JPEG", "WEBP") else {}
+    Image.fromarray(image[..., ::-1] if bgr else image).save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def render_display(image, entry, names, max_side=DISPLAY_MAX_SIDE, fmt=DISPLAY_FORMAT,
+                   quality=DISPLAY_QUALITY, in_place=False, bgr=False, box_scale=1.0):
+    """Aperçu annoté encodé (JPEG/WebP), côté le plus long limité à `max_side`.
+
+    L'image est réduite avant le dessin : les boîtes sont tracées sur le petit
+    tampon. Sans réduction, `in_place=True` évite toute copie de `image`.
+    `box_scale` ramène les boîtes de l'entrée dans le repère de `image` (image
+    décodée en résolution réduite, voir inference.decode_reduced).
+    """
+    small, scale = _downscale(image, max_side)
+    if small is None:
+        small = image if in_place else image.copy()
+    small = draw_detections(small, entry, names, scale=scale * box_scale, bgr=bgr)
+    return encode(small, fmt, quality, bgr=bgr)
+
+
+def render_full(image, entry, names, in_place=False):
+    """Image annotée pleine résolution en PNG, pour le téléchargement à la demande"""
+    canvas = image if in_place else image.copy()
+    canvas = draw_detections(canvas, entry, names)
+    return encode(canvas, "PNG")
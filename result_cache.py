@@ -0,0 +1,161 @@
+# result_cache.py
+# Cache des résultats de détection indexé par le contenu de l'image
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from detections import Detections
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+# ---------------------------------------
+# 🔑 EMPREINTES
+# ---------------------------------------
+def hash_bytes(data):
+    """Empreinte SHA-256 d'un contenu binaire"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Empreinte d'un fichier, recalculée uniquement si sa taille ou sa date changent"""
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    with _file_hashes_lock:
+        _file_hashes[path] = (signature, value)
+    return value
+
+
+def model_fingerprint(path, backend="pytorch"):
+    """Identité du modèle : empreinte du checkpoint et backend d'exécution"""
+    return f"{file_hash(path)}:{backend}"
+
+
+def make_key(image_hash, model_hash, conf, imgsz, mode=""):
+    """Clé de cache combinant image, modèle et paramètres d'inférence.
+
+    `mode` distingue les variantes de pipeline (ex. paramètres de tuilage).
+    """
+    return hash_bytes(f"{image_hash}|{model_hash}|{float(conf):.4f}|{int(imgsz)}|{mode}".encode())
+
+
+# ---------------------------------------
+# 📦 ENTRÉES COMPACTES
+# ---------------------------------------
+def entry_from_result(r, preview=None):
+    """Convertit un résultat YOLO en entrée compacte (boîtes, classes, scores).
+
+    `preview` est l'aperçu annoté déjà encodé (voir renderer.render_display).
+    """
+    entry = Detections.from_result(r).to_entry()
+    entry["preview"] = preview
+    return entry
+
+
+def scale_entry(entry, scale):
+    """Ramène les boîtes d'une entrée prédite sur une image réduite au repère d'origine"""
+    if scale != 1.0 and entry["boxes"]:
+        boxes = Detections.from_entry(entry).xyxy.astype(float) * scale
+        entry["boxes"] = boxes.round(1).tolist()
+    return entry
+
+
+# ---------------------------------------
+# 🗃️ CACHE LRU (MÉMOIRE + DISQUE OPTIONNEL)
+# ---------------------------------------
+class DetectionCache:
+    """Cache LRU thread-safe des détections, avec persistance optionnelle sur disque"""
+
+    def __init__(self, max_entries=256, persist_dir=None):
+        self.max_entries = max_entries
+        self.persist_dir = persist_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._remember(key, entry)
+        self._store(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _paths(self, key):
+        base = os.path.join(self.persist_dir, key)
+        return base + ".json", base + ".preview"
+
+    def _load(self, key):
+        if not self.persist_dir:
+            return None
+        json_path, preview_path = self._paths(key)
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry["preview"] = None
+        if os.path.exists(preview_path):
+            with open(preview_path, "rb") as f:
+                entry["preview"] = f.read()
+        return entry
+
+    def _store(self, key, entry):
+        if not self.persist_dir:
+            return
+        json_path, preview_path = self._paths(key)
+        try:
+            if entry.get("preview"):
+                with open(preview_path, "wb") as f:
+                    f.write(entry["preview"])
+            # Écriture atomique du JSON, qui sert de marqueur de complétude
+            tmp_path = json_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({k: v for k, v in entry.items() if k != "preview"}, f)
+            os.replace(tmp_path, json_path)
+        except OSError:
+            pass
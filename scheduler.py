@@ -0,0 +1,150 @@
+# scheduler.py
+# Ordonnanceur de micro-lots : regroupe les requêtes concurrentes en un seul appel predict
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import Future
+
+from inference import DEFAULT_BATCH_SIZE, DEFAULT_CONF, DEFAULT_IMGSZ, predict_batched
+from metrics import METRICS
+
+_Request = namedtuple("_Request", "image conf imgsz future enqueued_at")
+
+
+class BatchScheduler:
+    """File d'attente devant `model.predict`.
+
+    Un thread de fond attend la première requête, puis accumule les suivantes
+    jusqu'à `max_batch_size` éléments ou `max_wait_ms` millisecondes, et lance
+    un appel `predict` par groupe (conf, imgsz). Chaque appelant récupère son
+    propre résultat via un `Future`.
+    """
+
+    def __init__(self, model, max_batch_size=DEFAULT_BATCH_SIZE, max_wait_ms=5.0):
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._model_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._requests = 0
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    # ---------------------------------------
+    # 📨 SOUMISSION
+    # ---------------------------------------
+    def submit(self, image, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ):
+        """Met une image en file et renvoie un Future résolu avec son résultat YOLO"""
+        future = Future()
+        with self._submit_lock:
+            if not self._closed:
+                self._queue.put(_Request(image, conf, imgsz, future, time.perf_counter()))
+                return future
+
+        # Ordonnanceur arrêté (modèle remplacé) : appel direct pour ne pas bloquer l'appelant
+        try:
+            with self._model_lock:
+                future.set_result(self.model.predict(image, conf=conf, imgsz=imgsz, verbose=False)[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def predict(self, image, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ, timeout=None):
+        """Version bloquante de `submit`"""
+        return self.submit(image, conf, imgsz).result(timeout)
+
+    def predict_many(self, images, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ,
+                     batch_size=DEFAULT_BATCH_SIZE):
+        """Traite un lot déjà constitué en gardant l'accès exclusif au modèle"""
+        with self._model_lock:
+            return predict_batched(self.model, images, conf=conf, imgsz=imgsz, batch_size=batch_size)
+
+    def close(self):
+        """Arrête le thread après avoir vidé la file"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    # ---------------------------------------
+    # 📈 STATISTIQUES
+    # ---------------------------------------
+    def stats(self):
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "requests": self._requests,
+                "mean_batch_size": self._requests / batches if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "mean_wait_ms": 1000.0 * self._wait_total / self._requests if self._requests else 0.0,
+                "max_wait_ms": 1000.0 * self._wait_max,
+            }
+
+    # ---------------------------------------
+    # ⚙️ BOUCLE DE TRAITEMENT
+    # ---------------------------------------
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Réinjecte le signal d'arrêt pour le prochain tour
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [req for req in batch if req.future.set_running_or_notify_cancel()]
+
+            groups = {}
+            for req in batch:
+                groups.setdefault((req.conf, req.imgsz), []).append(req)
+
+            for (conf, imgsz), requests in groups.items():
+                started = time.perf_counter()
+                try:
+                    with self._model_lock, METRICS.stage("scheduler_batch_predict"):
+                        results = self.model.predict(
+                            [req.image for req in requests], conf=conf, imgsz=imgsz, verbose=False
+                        )
+                except Exception as e:
+                    for req in requests:
+                        req.future.set_exception(e)
+                else:
+                    for req, result in zip(requests, results):
+                        req.future.set_result(result)
+                self._record(requests, started)
+
+    def _record(self, requests, started):
+        with self._stats_lock:
+            self._batch_sizes[len(requests)] += 1
+            self._requests += len(requests)
+            for req in requests:
+                wait = started - req.enqueued_at
+                METRICS.observe("scheduler_queue_wait", wait)
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
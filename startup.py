@@ -0,0 +1,182 @@
+# startup.py
+# Démarrage à froid : le modèle est chargé et préchauffé avant la première session,
+# avec mesure des temps d'import, de chargement et de préchauffage
+#
+# Usage :
+#   python startup.py serve                      # préchauffe puis lance poubelle.py
+#   python startup.py serve -- --server.port 8502
+#   python startup.py bench --runs 5             # banc d'essai du démarrage à froid
+#   python startup.py bench --baseline runs/startup/<date>/results.json
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from metrics import METRICS
+
+APP_SCRIPT = "poubelle.py"
+# Modules chargés par la page avant tout affichage (hors Streamlit)
+APP_MODULES = (
+    "cascade", "classifier", "inference", "detections", "history", "metrics", "model_info", "model_registry",
+    "result_cache", "renderer", "tiling",
+)
+# Écart absolu ignoré par la détection de régression (bruit de mesure)
+MIN_REGRESSION_S = 0.05
+
+
+# ---------------------------------------
+# 🚀 PRÉCHARGEMENT
+# ---------------------------------------
+def preload(registry, version=None, verbose=True):
+    """Importe ultralytics, charge et préchauffe `version`; renvoie les temps (s).
+
+    Appelé au démarrage du serveur, hors de toute session : la première
+    requête trouve un modèle résident dont le premier `predict` a déjà eu lieu.
+    """
+    started = time.perf_counter()
+    try:
+        import ultralytics  # noqa: F401  (torch compris : l'essentiel du coût)
+    except ImportError:
+        pass
+    timings = {"import_s": round(time.perf_counter() - started, 3)}
+
+    handle = registry.get(version)
+    if handle is not None:
+        timings.update(handle.timings)
+    timings["total_s"] = round(time.perf_counter() - started, 3)
+
+    for name, seconds in timings.items():
+        METRICS.observe(f"startup_{name[:-2]}", seconds)
+    if verbose:
+        print("🚀 Démarrage : " + ", ".join(f"{name[:-2]} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
+
+
+def serve(streamlit_args):
+    """Précharge le registre partagé puis lance Streamlit dans le même processus"""
+    from model_registry import shared_registry
+
+    preload(shared_registry())
+    from streamlit.web import cli as stcli
+
+    sys.argv = ["streamlit", "run", APP_SCRIPT, *streamlit_args]
+    sys.exit(stcli.main())
+
+
+# ---------------------------------------
+# 📏 BANC D'ESSAI DU DÉMARRAGE À FROID
+# ---------------------------------------
+def measure_cold_start(weights=None, imgsz=None):
+    """Temps de démarrage mesurés dans le processus courant (à appeler dans un processus neuf)"""
+    timings = {}
+    started = time.perf_counter()
+    for module in APP_MODULES:
+        importlib.import_module(module)
+    timings["app_import_s"] = round(time.perf_counter() - started, 3)
+
+    import numpy as np
+    from inference import DEFAULT_IMGSZ, MODEL_PATH
+    from model_registry import ModelRegistry
+
+    weights = weights or MODEL_PATH
+    imgsz = imgsz or DEFAULT_IMGSZ
+    registry = ModelRegistry(
+        models_dir=os.path.dirname(weights) or ".",
+        default_version=os.path.splitext(os.path.basename(weights))[0],
+        warmup_imgsz=imgsz,
+    )
+    timings.update(preload(registry, verbose=False))
+    handle = registry.get()
+    if handle is None:
+        raise FileNotFoundError(weights)
+
+    # Premier appel après préchauffage : doit être proche du régime établi
+    image = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    started = time.perf_counter()
+    handle.scheduler.predict(image, imgsz=imgsz)
+    timings["first_predict_s"] = round(time.perf_counter() - started, 3)
+    handle.scheduler.close()
+    registry.stop()
+    return timings
+
+
+def run_cold_start(weights, imgsz):
+    """Une mesure dans un interpréteur neuf (imports non encore en cache)"""
+    code = ("import json, startup; "
+            f"print(json.dumps(startup.measure_cold_start({weights!r}, {imgsz!r})))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def find_regressions(medians, baseline, tolerance=0.2):
+    """Étapes dont la médiane dépasse la référence de plus de `tolerance`"""
+    regressions = []
+    for name, value in medians.items():
+        ref = baseline.get(name)
+        if ref is None:
+            continue
+        if value > ref * (1 + tolerance) and value - ref > MIN_REGRESSION_S:
+            regressions.append(f"{name}: {ref:.3f}s → {value:.3f}s")
+    return regressions
+
+
+def bench(args):
+    from benchmark import git_revision
+
+    runs = []
+    for i in range(args.runs):
+        runs.append(run_cold_start(args.weights, args.imgsz))
+        print(f"  essai {i + 1}/{args.runs} : {runs[-1]}")
+    medians = {name: round(statistics.median(run[name] for run in runs), 3) for name in runs[0]}
+
+    os.makedirs(args.out, exist_ok=True)
+    json_path = os.path.join(args.out, "results.json")
+    meta = {"commit": git_revision(), "python": sys.version.split()[0], "runs": args.runs,
+            "weights": args.weights, "imgsz": args.imgsz}
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "medians": medians, "runs": runs}, f, indent=2)
+    print(json.dumps(medians, indent=2))
+    print(f"📄 {json_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["medians"]
+        regressions = find_regressions(medians, baseline, args.tolerance)
+        if regressions:
+            print("❌ Régressions du démarrage :")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ Pas de régression du démarrage")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Démarrage à froid : préchauffage et banc d'essai")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="Précharge le modèle puis lance l'application")
+    serve_parser.add_argument("streamlit_args", nargs=argparse.REMAINDER,
+                              help="Options transmises à `streamlit run` (après --)")
+
+    bench_parser = sub.add_parser("bench", help="Mesure le démarrage dans des processus neufs")
+    bench_parser.add_argument("--weights", default=None)
+    bench_parser.add_argument("--imgsz", type=int, default=None)
+    bench_parser.add_argument("--runs", type=int, default=5)
+    bench_parser.add_argument("--out", default=os.path.join("runs", "startup", time.strftime("%Y%m%d-%H%M%S")))
+    bench_parser.add_argument("--baseline", default=None, help="results.json de référence")
+    bench_parser.add_argument("--tolerance", type=float, default=0.2)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve([a for a in args.streamlit_args if a != "--"])
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
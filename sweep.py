@@ -0,0 +1,296 @@
+# sweep.py
+# Balayage précision / latence : entraîne une grille (modèle × imgsz × époques) en
+# parallèle sur les cœurs CPU, mesure la latence de chaque checkpoint et extrait la
+# frontière de Pareto mAP50-95 / ms par image
+#
+# Usage :
+#   python sweep.py --models yolov8n.pt yolov8s.pt --imgsz 320 480 640 --epochs 25 50 --budget-ms 40
+#   python sweep.py --jobs 2 --budget-ms 25 --out runs/sweep/essai   # reprend les runs terminés ou interrompus
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import product
+from multiprocessing import get_context
+
+from benchmark import git_revision, run_isolated
+from train_yolo import DEFAULT_DATA, DEFAULT_MODEL, autotune_workers, dataset_images
+from worker_pool import available_cores, split_cores
+
+DEFAULT_MODELS = (DEFAULT_MODEL, "yolov8s.pt")
+DEFAULT_IMGSZ_GRID = (320, 480, 640)
+DEFAULT_EPOCHS_GRID = (25, 50)
+# Colonnes de results.csv (ultralytics) lues pour chaque run
+MAP_COLUMN = "metrics/mAP50-95(B)"
+MAP50_COLUMN = "metrics/mAP50(B)"
+# Écrit dans le dossier du run une fois l'entraînement allé à son terme
+DONE_MARKER = "sweep_done.json"
+CSV_FIELDS = (
+    "run", "model", "imgsz", "epochs", "map50_95", "map50", "best_epoch", "train_s",
+    "p50_ms", "p95_ms", "img_per_s", "weights", "pareto",
+)
+
+
+def run_name(model, imgsz, epochs):
+    return f"{os.path.splitext(os.path.basename(model))[0]}_{imgsz}_{epochs}ep"
+
+
+# ---------------------------------------
+# 🗃️ CACHE DISQUE PARTAGÉ
+# ---------------------------------------
+def prime_disk_cache(data_yaml, workers=None):
+    """Écrit une fois les images décodées en `.npy`, à côté des originaux.
+
+    Même convention que `cache="disk"` d'ultralytics (tableau BGR de cv2.imread,
+    `<image>.npy`) : tous les runs du balayage, quel que soit leur imgsz,
+    relisent ces fichiers au lieu de décoder les JPEG, et aucun processus ne
+    les écrit en concurrence d'un autre.
+    """
+    import cv2
+    import numpy as np
+
+    paths = [p for split in ("train", "val") for p in dataset_images(data_yaml, split)]
+    missing = [p for p in paths if not os.path.exists(os.path.splitext(p)[0] + ".npy")]
+
+    def _save(path):
+        image = cv2.imread(path)
+        if image is not None:
+            np.save(os.path.splitext(path)[0] + ".npy", image, allow_pickle=False)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(_save, missing))
+    return len(paths), len(missing)
+
+
+# ---------------------------------------
+# 🏋️ ENTRAÎNEMENT D'UN POINT DE LA GRILLE
+# ---------------------------------------
+def read_results(save_dir):
+    """Meilleure époque de results.csv selon mAP50-95"""
+    with open(os.path.join(save_dir, "results.csv"), newline="", encoding="utf-8") as f:
+        rows = [{k.strip(): v for k, v in row.items()} for row in csv.DictReader(f)]
+    best = max(rows, key=lambda row: float(row[MAP_COLUMN]))
+    return {
+        "map50_95": round(float(best[MAP_COLUMN]), 4),
+        "map50": round(float(best[MAP50_COLUMN]), 4),
+        "best_epoch": int(float(best["epoch"])),
+    }
+
+
+def completed_epochs(save_dir):
+    """Nombre d'époques consignées dans results.csv (0 si le run n'a pas commencé)"""
+    try:
+        with open(os.path.join(save_dir, "results.csv"), newline="", encoding="utf-8") as f:
+            return sum(1 for _ in csv.DictReader(f))
+    except OSError:
+        return 0
+
+
+def run_state(save_dir, epochs):
+    """"done", "partial" (last.pt à reprendre) ou "new".
+
+    best.pt est écrit dès la première époque : seul le marqueur de fin, ou
+    results.csv complet, prouve qu'un run est allé à son terme.
+    """
+    if os.path.exists(os.path.join(save_dir, DONE_MARKER)) or completed_epochs(save_dir) >= epochs:
+        return "done"
+    if os.path.exists(os.path.join(save_dir, "weights", "last.pt")):
+        return "partial"
+    return "new"
+
+
+def train_job(job):
+    """Exécutée dans un processus dédié, épinglé sur son groupe de cœurs.
+
+    Un run interrompu repart de son last.pt (`resume=True` : ultralytics
+    reprend alors ses propres réglages, optimiseur et époque compris).
+    """
+    cores = job["cores"]
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(len(cores))
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    from train_yolo import train
+
+    workers, threads = autotune_workers(len(cores), device="cpu")
+    last = os.path.join(job["project"], job["run"], "weights", "last.pt")
+    resume = {"resume": True} if job.get("resume") else {}
+    started = time.perf_counter()
+    save_dir, _ = train(
+        data=job["data"], model_name=last if resume else job["model"], epochs=job["epochs"],
+        imgsz=job["imgsz"], batch=job["batch"], name=job["run"], cache="disk", workers=workers,
+        threads=threads, device="cpu", project=job["project"], exist_ok=True, plots=False, **resume,
+    )
+    summary = {"save_dir": save_dir, "train_s": round(time.perf_counter() - started, 1), "resumed": bool(resume)}
+    with open(os.path.join(save_dir, DONE_MARKER), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def recorded_train_s(save_dir):
+    """Durée notée par le marqueur de fin d'un run entraîné lors d'un balayage précédent"""
+    try:
+        with open(os.path.join(save_dir, DONE_MARKER), encoding="utf-8") as f:
+            return json.load(f).get("train_s")
+    except (OSError, ValueError):
+        return None
+
+
+def train_grid(jobs, parallel):
+    """Entraîne les runs `parallel` à la fois, chacun sur sa part des cœurs"""
+    ctx = get_context("spawn")
+    groups = split_cores(available_cores(), parallel)
+    done = {}
+    with ProcessPoolExecutor(max_workers=len(groups), mp_context=ctx) as pool:
+        # Un groupe de cœurs par emplacement : le run suivant reprend celui du run terminé
+        pending, queue = {}, list(jobs)
+        free = list(groups)
+        while queue or pending:
+            while queue and free:
+                job = dict(queue.pop(0), cores=free.pop(0))
+                pending[pool.submit(train_job, job)] = job
+            future = next(as_completed(pending))
+            job = pending.pop(future)
+            free.append(job["cores"])
+            try:
+                done[job["run"]] = future.result()
+                print(f"  ✅ {job['run']} ({done[job['run']]['train_s']:.0f}s, cœurs {job['cores']})")
+            except Exception as e:
+                print(f"  ❌ {job['run']} : {e}")
+    return done
+
+
+# ---------------------------------------
+# 📈 FRONTIÈRE DE PARETO
+# ---------------------------------------
+def pareto_front(rows, accuracy="map50_95", latency="p50_ms"):
+    """Runs non dominés : aucun autre n'est à la fois plus précis et plus rapide"""
+    front = []
+    for row in sorted(rows, key=lambda r: (r[latency], -r[accuracy])):
+        if not front or row[accuracy] > front[-1][accuracy]:
+            front.append(row)
+    return front
+
+
+def best_within_budget(rows, budget_ms, accuracy="map50_95", latency="p50_ms"):
+    """Run le plus précis dont la latence tient dans le budget (None si aucun)"""
+    fitting = [row for row in rows if row[latency] <= budget_ms]
+    return max(fitting, key=lambda row: (row[accuracy], -row[latency])) if fitting else None
+
+
+def write_report(rows, out_dir, meta):
+    json_path = os.path.join(out_dir, "results.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": rows}, f, indent=2)
+    csv_path = os.path.join(out_dir, "results.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return json_path, csv_path
+
+
+# ---------------------------------------
+# 🚀 POINT D'ENTRÉE
+# ---------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Balayage précision / latence des réglages d'entraînement")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--models", nargs="+", default=list(DEFAULT_MODELS))
+    parser.add_argument("--imgsz", type=int, nargs="+", default=list(DEFAULT_IMGSZ_GRID))
+    parser.add_argument("--epochs", type=int, nargs="+", default=list(DEFAULT_EPOCHS_GRID))
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Entraînements simultanés (défaut : un par groupe de 4 cœurs)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Latence p50 maximale par image")
+    parser.add_argument("--latency-images", type=int, default=32, help="Images de validation chronométrées")
+    parser.add_argument("--latency-threads", type=int, default=None, help="Threads d'inférence (défaut : tous)")
+    parser.add_argument("--out", default=os.path.join("runs", "sweep", time.strftime("%Y%m%d-%H%M%S")))
+    args = parser.parse_args()
+
+    out_dir = os.path.abspath(args.out)
+    project = os.path.join(out_dir, "train")
+    os.makedirs(project, exist_ok=True)
+    cores = available_cores()
+    parallel = args.jobs or max(1, len(cores) // 4)
+
+    total, written = prime_disk_cache(args.data)
+    print(f"🗃️ Cache disque : {total} images, {written} nouvelles")
+
+    grid = [
+        {"run": run_name(model, imgsz, epochs), "model": model, "imgsz": imgsz, "epochs": epochs,
+         "data": args.data, "batch": args.batch, "project": project}
+        for model, imgsz, epochs in product(args.models, args.imgsz, args.epochs)
+    ]
+    # Reprise : un run terminé n'est pas réentraîné, un run interrompu repart de last.pt
+    states = {job["run"]: run_state(os.path.join(project, job["run"]), job["epochs"]) for job in grid}
+    todo = [dict(job, resume=states[job["run"]] == "partial") for job in grid if states[job["run"]] != "done"]
+    resumed = sum(job["resume"] for job in todo)
+    print(f"🏋️ {len(todo)}/{len(grid)} entraînements ({resumed} repris), "
+          f"{parallel} en parallèle sur {len(cores)} cœurs")
+    trained = train_grid(todo, parallel)
+
+    # Latences mesurées une par une, sur tous les cœurs, après les entraînements
+    latency_images = dataset_images(args.data, "val")[:args.latency_images]
+    if not latency_images:
+        raise SystemExit("❌ Aucune image de validation pour mesurer la latence")
+    ctx = get_context("spawn")
+    rows = []
+    for job in grid:
+        save_dir = os.path.join(project, job["run"])
+        weights = os.path.join(save_dir, "weights", "best.pt")
+        if job["run"] not in trained and states[job["run"]] != "done":
+            if os.path.exists(weights):
+                print(f"  ⚠️ {job['run']} : entraînement incomplet, ignoré")
+            continue
+        config = {
+            "weights": weights, "images": latency_images, "backend": "pytorch", "imgsz": job["imgsz"],
+            "batch": 1, "threads": args.latency_threads or len(cores), "warmup": 2, "repeat": 1,
+        }
+        latency = run_isolated(config, ctx)
+        row = {
+            "run": job["run"], "model": job["model"], "imgsz": job["imgsz"], "epochs": job["epochs"],
+            **read_results(save_dir),
+            "train_s": trained.get(job["run"], {}).get("train_s", recorded_train_s(save_dir)),
+            "p50_ms": latency["p50_ms"], "p95_ms": latency["p95_ms"], "img_per_s": latency["img_per_s"],
+            "weights": os.path.relpath(weights),
+        }
+        print(f"  {row['run']:<24} mAP50-95={row['map50_95']:.3f}  p50={row['p50_ms']:.1f} ms")
+        rows.append(row)
+    if not rows:
+        raise SystemExit("❌ Aucun checkpoint à évaluer")
+
+    front = {row["run"] for row in pareto_front(rows)}
+    for row in rows:
+        row["pareto"] = row["run"] in front
+    choice = best_within_budget(rows, args.budget_ms) if args.budget_ms is not None else None
+    meta = {
+        "commit": git_revision(),
+        "data": args.data,
+        "cpu_count": len(cores),
+        "parallel": parallel,
+        "budget_ms": args.budget_ms,
+        "choice": choice["run"] if choice else None,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    json_path, csv_path = write_report(rows, out_dir, meta)
+
+    print("\n📈 Frontière de Pareto (mAP50-95 / ms par image) :")
+    for row in sorted((r for r in rows if r["pareto"]), key=lambda r: r["p50_ms"]):
+        print(f"  {row['p50_ms']:>8.1f} ms  {row['map50_95']:.3f}  {row['run']}  ({row['weights']})")
+    if args.budget_ms is not None:
+        if choice:
+            print(f"🎯 Budget {args.budget_ms:g} ms : {choice['run']} → {choice['weights']}")
+        else:
+            print(f"⚠️ Aucun checkpoint sous {args.budget_ms:g} ms")
+    print(f"📄 {json_path}\n📄 {csv_path}")
+    if args.budget_ms is not None and not choice:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# tiling.py
+# Inférence par tuiles pour les images haute résolution : découpe avec recouvrement,
+# tuiles traitées par lots, fusion des détections par NMS inter-tuiles
+#
+# Banc d'essai rappel / latence contre l'inférence pleine image :
+#   python tiling.py dataset/valid/images --labels dataset/valid/labels --tile 640 --overlap 0.2
+import argparse
+import glob
+import json
+import os
+import time
+from functools import partial
+
+import numpy as np
+
+from inference import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CONF, DEFAULT_IMGSZ, MODEL_PATH, decode_image, load_yolo, predict_batched,
+)
+
+DEFAULT_TILE_SIZE = 640
+DEFAULT_OVERLAP = 0.2
+# Fusion : une boîte coupée par un bord de tuile est surtout *contenue* dans la boîte
+# entière voisine, d'où le critère intersection / plus petite aire plutôt que l'IoU
+MERGE_THRESHOLD = 0.6
+
+
+def make_tiles(height, width, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP):
+    """Fenêtres (x0, y0, x1, y1) couvrant l'image avec le recouvrement demandé"""
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height) for x in starts(width)
+    ]
+
+
+def merge_detections(boxes, classes, scores, threshold=MERGE_THRESHOLD):
+    """NMS par classe sur le critère intersection / plus petite aire; renvoie les indices gardés"""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    for cls in np.unique(classes):
+        order = np.where(classes == cls)[0]
+        order = order[np.argsort(-scores[order])]
+        while len(order):
+            best, rest = order[0], order[1:]
+            keep.append(best)
+            if not len(rest):
+                break
+            x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+            y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+            x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+            y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+            inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+            ios = inter / (np.minimum(areas[best], areas[rest]) + 1e-9)
+            order = rest[ios < threshold]
+    return np.array(sorted(keep, key=lambda i: -scores[i]), dtype=int)
+
+
+def sliced_predict(predict_many, image, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP,
+                   conf=DEFAULT_CONF, batch_size=DEFAULT_BATCH_SIZE, full_frame=True,
+                   imgsz=DEFAULT_IMGSZ):
+    """Détection par tuiles; renvoie une entrée compacte (voir result_cache).
+
+    `predict_many(images, conf=, imgsz=, batch_size=)` traite une liste d'images,
+    par exemple `BatchScheduler.predict_many`. Les tuiles sont des vues sur
+    l'image (aucune copie) et passent par lots de `batch_size`, chacune à
+    `imgsz=tile_size`. Avec `full_frame`, une passe pleine image à `imgsz`
+    complète les tuiles pour les objets plus grands qu'une tuile.
+    """
+    height, width = image.shape[:2]
+    windows = make_tiles(height, width, tile_size, overlap)
+    crops = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+
+    all_boxes, all_classes, all_scores = [], [], []
+    tile_results = predict_many(crops, conf=conf, imgsz=tile_size, batch_size=batch_size)
+    for (x0, y0, _, _), r in zip(windows, tile_results):
+        if r.boxes is None or len(r.boxes) == 0:
+            continue
+        all_boxes.append(r.boxes.xyxy.cpu().numpy() + np.array([x0, y0, x0, y0], dtype=np.float32))
+        all_classes.append(r.boxes.cls.cpu().numpy().astype(int))
+        all_scores.append(r.boxes.conf.cpu().numpy())
+
+    if full_frame and len(windows) > 1:
+        r = predict_many([image], conf=conf, imgsz=imgsz, batch_size=1)[0]
+        if r.boxes is not None and len(r.boxes) > 0:
+            all_boxes.append(r.boxes.xyxy.cpu().numpy())
+            all_classes.append(r.boxes.cls.cpu().numpy().astype(int))
+            all_scores.append(r.boxes.conf.cpu().numpy())
+
+    if not all_boxes:
+        return {"boxes": [], "classes": [], "scores": [], "preview": None, "tiles": len(windows)}
+
+    boxes = np.concatenate(all_boxes)
+    classes = np.concatenate(all_classes)
+    scores = np.concatenate(all_scores)
+    keep = merge_detections(boxes, classes, scores)
+    return {
+        "boxes": boxes[keep].round(1).tolist(),
+        "classes": [int(c) for c in classes[keep]],
+        "scores": [round(float(s), 4) for s in scores[keep]],
+        "preview": None,
+        "tiles": len(windows),
+    }
+
+
+# ---------------------------------------
+# 📏 BANC D'ESSAI RAPPEL / LATENCE
+# ---------------------------------------
+def load_labels(path, width, height):
+    """Boîtes xyxy en pixels d'un fichier d'annotations YOLO (cx cy w h normalisés)"""
+    if not os.path.exists(path):
+        return np.zeros((0, 4))
+    rows = np.loadtxt(path, ndmin=2)
+    if rows.size == 0:
+        return np.zeros((0, 4))
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+
+def count_matches(truth, predicted, min_iou=0.5):
+    """Nombre de boîtes de vérité retrouvées (IoU >= min_iou, appariement glouton)"""
+    if len(truth) == 0 or len(predicted) == 0:
+        return 0
+    predicted = np.asarray(predicted, dtype=np.float64)
+    used = np.zeros(len(predicted), dtype=bool)
+    found = 0
+    for box in truth:
+        x1 = np.maximum(box[0], predicted[:, 0])
+        y1 = np.maximum(box[1], predicted[:, 1])
+        x2 = np.minimum(box[2], predicted[:, 2])
+        y2 = np.minimum(box[3], predicted[:, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        union = ((box[2] - box[0]) * (box[3] - box[1])
+                 + (predicted[:, 2] - predicted[:, 0]) * (predicted[:, 3] - predicted[:, 1]) - inter)
+        iou = np.where(used, 0.0, inter / (union + 1e-9))
+        best = int(iou.argmax())
+        if iou[best] >= min_iou:
+            used[best] = True
+            found += 1
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rappel et latence : tuiles vs pleine image")
+    parser.add_argument("images", help="Dossier d'images annotées")
+    parser.add_argument("--labels", default=None, help="Dossier des .txt YOLO (défaut : ../labels)")
+    parser.add_argument("--weights", default=MODEL_PATH)
+    parser.add_argument("--tile", type=int, default=DEFAULT_TILE_SIZE)
+    parser.add_argument("--overlap", type=float, default=DEFAULT_OVERLAP)
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH_SIZE, help="Tuiles par appel predict")
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    labels_dir = args.labels or os.path.join(os.path.dirname(os.path.normpath(args.images)), "labels")
+    paths = sorted(p for ext in ("jpg", "jpeg", "png") for p in glob.glob(os.path.join(args.images, f"*.{ext}")))
+    paths = paths[:args.limit]
+    model = load_yolo(args.weights)
+    if model is None:
+        raise SystemExit(f"❌ Modèle introuvable : {args.weights}")
+    predict_many = partial(predict_batched, model)
+
+    stats = {mode: {"found": 0, "seconds": 0.0} for mode in ("full_frame", "tiled")}
+    total_truth = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            image = decode_image(f.read())
+        height, width = image.shape[:2]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        truth = load_labels(os.path.join(labels_dir, f"{stem}.txt"), width, height)
+        total_truth += len(truth)
+
+        started = time.perf_counter()
+        r = model.predict(image, conf=args.conf, imgsz=DEFAULT_IMGSZ, verbose=False)[0]
+        stats["full_frame"]["seconds"] += time.perf_counter() - started
+        stats["full_frame"]["found"] += count_matches(truth, r.boxes.xyxy.cpu().numpy())
+
+        started = time.perf_counter()
+        entry = sliced_predict(predict_many, image, tile_size=args.tile, overlap=args.overlap,
+                               conf=args.conf, batch_size=args.batch)
+        stats["tiled"]["seconds"] += time.perf_counter() - started
+        stats["tiled"]["found"] += count_matches(truth, entry["boxes"])
+
+    report = {
+        mode: {
+            "recall": round(s["found"] / total_truth, 4) if total_truth else None,
+            "ms_per_image": round(1000.0 * s["seconds"] / len(paths), 1) if paths else None,
+        }
+        for mode, s in stats.items()
+    }
+    report["images"] = len(paths)
+    report["ground_truth_boxes"] = total_truth
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,225 @@
-from ultralytics import YOLO
-
-# Charger un modèle pré-entraîné
-model = YOLO("yolov8n.pt")  # léger et rapide
-
-# Entraînement
-model.train(
-    data="detection_poubelle.v1i.yolov8/data.yaml",   # chemin vers ton dataset
-    epochs=50,
-    imgsz=640,
-    batch=8,
-    name="trash_detector",
-    pretrained=True
-)
+# train_yolo.py
+# Entraînement YOLO configurable : cache d'images pré-décodées, réglage automatique
+# des threads / workers et mesure par époque du temps de chargement vs calcul
+#
+# Usage :
+#   python train_yolo.py                                  # réglages par défaut
+#   python train_yolo.py --cache disk --epochs 100 --imgsz 480
+import argparse
+import csv
+import glob
+import os
+import time
+
+import yaml
+
+DEFAULT_DATA = "detection_poubelle.v1i.yolov8/data.yaml"   # chemin vers ton dataset
+DEFAULT_MODEL = "yolov8n.pt"  # léger et rapide
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "bmp", "webp")
+
+# Part de la RAM disponible qu'on accepte de consacrer au cache d'images
+RAM_CACHE_FRACTION = 0.5
+
+
+# ---------------------------------------
+# 🧮 RÉGLAGE AUTOMATIQUE
+# ---------------------------------------
+def autotune_workers(cpu_count=None, device="cpu"):
+    """Répartit les cœurs entre chargement des données (workers) et calcul (threads torch).
+
+    Avec un cache d'images, les workers ne font plus qu'augmenter les données :
+    un quart des cœurs suffit, le reste va au calcul. Sur CPU, ultralytics
+    force workers=0 (chargement dans le processus principal) : tous les
+    cœurs vont alors au calcul.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if str(device) == "cpu":
+        return 0, cpu_count
+    workers = max(1, min(8, cpu_count // 4))
+    threads = max(1, cpu_count - workers)
+    return workers, threads
+
+
+def available_memory_bytes():
+    """Mémoire disponible (None si inconnue)"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def dataset_images(data_yaml, split="train"):
+    """Chemins des images d'une partition (train / val / test) référencée par data.yaml"""
+    with open(data_yaml, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    root = data.get("path") or os.path.dirname(os.path.abspath(data_yaml))
+    entry = data.get(split)
+    sources = entry if isinstance(entry, list) else [entry]
+    paths = []
+    for source in filter(None, sources):
+        folder = source if os.path.isabs(source) else os.path.normpath(os.path.join(root, source))
+        for ext in IMAGE_EXTENSIONS:
+            paths.extend(glob.glob(os.path.join(folder, "**", f"*.{ext}"), recursive=True))
+    return sorted(paths)
+
+
+def count_training_images(data_yaml):
+    """Nombre d'images d'entraînement référencées par data.yaml"""
+    return len(dataset_images(data_yaml, "train"))
+
+
+def choose_cache(mode, data_yaml, imgsz):
+    """Résout --cache auto : RAM si le jeu redimensionné y tient, sinon .npy sur disque"""
+    if mode != "auto":
+        return False if mode == "none" else mode
+    try:
+        n_images = count_training_images(data_yaml)
+    except (OSError, yaml.YAMLError):
+        return "disk"
+    needed = n_images * imgsz * imgsz * 3
+    available = available_memory_bytes()
+    if available is not None and needed < available * RAM_CACHE_FRACTION:
+        return "ram"
+    return "disk"
+
+
+# ---------------------------------------
+# ⏱️ TEMPS PAR ÉPOQUE
+# ---------------------------------------
+class EpochTimer:
+    """Callbacks ultralytics mesurant l'attente des données et le calcul par époque.
+
+    Le lot suivant est chargé entre `on_train_batch_end` et `on_train_batch_start` :
+    cet intervalle est compté comme attente des données, le reste comme calcul.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self._mark = None
+        self._epoch_start = None
+        self._train_end = None
+        self._data = 0.0
+        self._compute = 0.0
+        self._batches = 0
+
+    def on_train_epoch_start(self, trainer):
+        self._epoch_start = self._mark = time.perf_counter()
+        self._data = self._compute = 0.0
+        self._batches = 0
+
+    def on_train_batch_start(self, trainer):
+        now = time.perf_counter()
+        self._data += now - self._mark
+        self._mark = now
+
+    def on_train_batch_end(self, trainer):
+        now = time.perf_counter()
+        self._compute += now - self._mark
+        self._mark = now
+        self._batches += 1
+
+    def on_train_epoch_end(self, trainer):
+        self._train_end = time.perf_counter()
+
+    def on_fit_epoch_end(self, trainer):
+        now = time.perf_counter()
+        train_s = self._train_end - self._epoch_start
+        row = {
+            "epoch": trainer.epoch + 1,
+            "batches": self._batches,
+            "data_wait_s": round(self._data, 3),
+            "compute_s": round(self._compute, 3),
+            "train_s": round(train_s, 3),
+            "val_s": round(now - self._train_end, 3),
+            "data_wait_pct": round(100.0 * self._data / train_s, 1) if train_s > 0 else 0.0,
+        }
+        self.rows.append(row)
+        print(f"⏱️ Époque {row['epoch']}: données {row['data_wait_s']:.1f}s "
+              f"({row['data_wait_pct']:.0f}%), calcul {row['compute_s']:.1f}s, val {row['val_s']:.1f}s")
+        self.write(os.path.join(str(trainer.save_dir), "timing.csv"))
+
+    def write(self, path):
+        if not self.rows:
+            return
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.rows[0]))
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def attach(self, model):
+        for event in ("on_train_epoch_start", "on_train_batch_start", "on_train_batch_end",
+                      "on_train_epoch_end", "on_fit_epoch_end"):
+            model.add_callback(event, getattr(self, event))
+
+
+# ---------------------------------------
+# 🏋️ ENTRAÎNEMENT
+# ---------------------------------------
+def train(data=DEFAULT_DATA, model_name=DEFAULT_MODEL, epochs=50, imgsz=640, batch=8,
+          name="trash_detector", cache="auto", workers=None, threads=None, device="cpu",
+          **overrides):
+    """Lance l'entraînement et renvoie (dossier de sortie, métriques finales)"""
+    import torch
+    from ultralytics import YOLO
+
+    auto_workers, auto_threads = autotune_workers(device=device)
+    if str(device) == "cpu" and workers:
+        print(f"⚠️ workers={workers} ignoré : ultralytics charge les données sans worker sur CPU")
+    workers = auto_workers if workers is None else workers
+    threads = threads or auto_threads
+    torch.set_num_threads(threads)
+    cache = choose_cache(cache, data, imgsz)
+    print(f"⚙️ cache={cache} workers={workers} threads={threads} device={device}")
+
+    # Charger un modèle pré-entraîné
+    model = YOLO(model_name)
+    timer = EpochTimer()
+    timer.attach(model)
+
+    model.train(
+        data=data,
+        epochs=epochs,
+        imgsz=imgsz,
+        batch=batch,
+        name=name,
+        pretrained=True,
+        cache=cache,
+        workers=workers,
+        device=device,
+        **overrides
+    )
+    trainer = model.trainer
+    return str(trainer.save_dir), getattr(trainer, "metrics", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entraînement du détecteur de poubelles")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--name", default="trash_detector")
+    parser.add_argument("--cache", choices=("auto", "ram", "disk", "none"), default="auto",
+                        help="Images pré-décodées et redimensionnées en RAM ou en .npy sur disque")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Workers de chargement (défaut : auto; sans effet sur CPU)")
+    parser.add_argument("--threads", type=int, default=None, help="Threads torch (défaut : auto)")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    save_dir, _ = train(
+        data=args.data, model_name=args.model, epochs=args.epochs, imgsz=args.imgsz,
+        batch=args.batch, name=args.name, cache=args.cache, workers=args.workers,
+        threads=args.threads, device=args.device,
+    )
+    print(f"✅ Entraînement terminé : {save_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# video.py
+# Détection sur vidéo ou flux (fichier MP4, URL RTSP/HTTP) avec saut d'images et suivi
+#
+# Usage en ligne de commande (fichier local) :
+#   python video.py rue.mp4 --every 3 --max-frames 600
+import argparse
+import json
+import queue
+import threading
+import time
+
+import cv2
+
+from inference import DEFAULT_CONF, DEFAULT_IMGSZ, MODEL_PATH, load_yolo
+
+DEFAULT_DETECT_EVERY = 3
+DEFAULT_TRACKER = "bytetrack.yaml"
+
+
+def is_stream(source):
+    """Vrai pour une URL de flux (lecture en direct, pas de fin de fichier)"""
+    return str(source).lower().startswith(("rtsp://", "rtmp://", "http://", "https://"))
+
+
+# ---------------------------------------
+# 📼 LECTURE DES IMAGES EN ARRIÈRE-PLAN
+# ---------------------------------------
+class FrameReader:
+    """Décode les images dans un thread de fond vers une file bornée.
+
+    Pour un fichier, le lecteur attend que la file se libère (aucune image
+    perdue). Pour un flux en direct, l'image la plus ancienne est jetée afin
+    de rester en temps réel quand l'inférence prend du retard.
+    """
+
+    def __init__(self, source, max_queue=8):
+        self.source = source
+        self.live = is_stream(source)
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise IOError(f"Impossible d'ouvrir la source vidéo : {source}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 25.0
+        self.total_frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-reader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        index = 0
+        try:
+            while not self._stop.is_set():
+                ok, frame = self.capture.read()
+                if not ok:
+                    break
+                item = (index, index / self.fps, frame)
+                if self.live:
+                    while True:
+                        try:
+                            self._queue.put_nowait(item)
+                            break
+                        except queue.Full:
+                            try:
+                                self._queue.get_nowait()
+                                self.dropped += 1
+                            except queue.Empty:
+                                pass
+                else:
+                    while not self._stop.is_set():
+                        try:
+                            self._queue.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                index += 1
+        finally:
+            self.capture.release()
+            while True:
+                try:
+                    self._queue.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    if self._stop.is_set():
+                        break
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self):
+        self._stop.set()
+        # Débloque le thread s'il attend une place dans la file
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._thread.join(timeout=2)
+
+
+# ---------------------------------------
+# 🛰️ DÉTECTION + SUIVI
+# ---------------------------------------
+def process_video(model, source, detect_every=DEFAULT_DETECT_EVERY, conf=DEFAULT_CONF,
+                  imgsz=DEFAULT_IMGSZ, tracker=DEFAULT_TRACKER, max_frames=None,
+                  on_frame=None):
+    """Détecte les poubelles toutes les `detect_every` images et suit les identifiants.
+
+    Le suivi ultralytics (`persist=True`) associe les boîtes d'une détection à
+    l'autre; entre deux détections, les dernières boîtes suivies sont reportées.
+    `on_frame(index, frame_bgr, result, detected)` est appelé pour chaque image.
+    Le modèle doit être dédié à cet appel : l'état du tracker y est attaché.
+
+    Renvoie un résumé avec la chronologie par poubelle suivie.
+    """
+    detect_every = max(1, int(detect_every))
+    reader = FrameReader(source)
+    timeline = {}
+    last_result = None
+    frames = processed = 0
+    started = time.perf_counter()
+
+    try:
+        for index, timestamp, frame in reader:
+            if max_frames and frames >= max_frames:
+                break
+            frames += 1
+            detected = index % detect_every == 0
+            if detected:
+                last_result = model.track(
+                    frame, persist=True, conf=conf, imgsz=imgsz, tracker=tracker, verbose=False
+                )[0]
+                processed += 1
+                _update_timeline(timeline, last_result, model.names, index, timestamp)
+            if on_frame is not None:
+                on_frame(index, frame, last_result, detected)
+    finally:
+        reader.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "source": str(source),
+        "frames": frames,
+        "detected_frames": processed,
+        "dropped_frames": reader.dropped,
+        "source_fps": reader.fps,
+        "throughput_fps": frames / elapsed if elapsed > 0 else 0.0,
+        "timeline": sorted(timeline.values(), key=lambda t: (t["first_frame"], t["track_id"])),
+    }
+
+
+def _update_timeline(timeline, result, names, index, timestamp):
+    boxes = getattr(result, "boxes", None)
+    if boxes is None or boxes.id is None:
+        return
+    for track_id, cls_idx, score in zip(boxes.id.tolist(), boxes.cls.tolist(), boxes.conf.tolist()):
+        track_id = int(track_id)
+        track = timeline.setdefault(track_id, {
+            "track_id": track_id,
+            "class_name": names[int(cls_idx)],
+            "first_frame": index,
+            "first_time_s": round(timestamp, 2),
+            "hits": 0,
+            "max_conf": 0.0,
+        })
+        track["last_frame"] = index
+        track["last_time_s"] = round(timestamp, 2)
+        track["hits"] += 1
+        track["max_conf"] = max(track["max_conf"], round(float(score), 4))
+
+
+# ---------------------------------------
+# 🚀 POINT D'ENTRÉE
+# ---------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Détection de poubelles sur vidéo ou flux")
+    parser.add_argument("source", help="Fichier vidéo local ou URL de flux (rtsp://...)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--every", type=int, default=DEFAULT_DETECT_EVERY,
+                        help="Détecter une image sur N")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    args = parser.parse_args()
+
+    model = load_yolo(args.model)
+    if model is None:
+        raise SystemExit(f"❌ Modèle introuvable : {args.model}")
+    summary = process_video(model, args.source, detect_every=args.every, conf=args.conf,
+                            imgsz=args.imgsz, max_frames=args.max_frames)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
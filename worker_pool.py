@@ -0,0 +1,325 @@
+# worker_pool.py
+# Pool multi-processus d'inférence CPU : N répliques du modèle, chacune épinglée sur
+# son propre groupe de cœurs avec un nombre fixe de threads torch. Les images passent
+# par mémoire partagée (pas de sérialisation pickle des pixels).
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from inference import DEFAULT_BATCH_SIZE, DEFAULT_CONF, DEFAULT_IMGSZ, MODEL_PATH
+
+# Taille d'un emplacement partagé : une photo RGB d'environ 21 Mpx.
+# Les images plus grandes sont transmises directement (sérialisées).
+DEFAULT_SLOT_MB = 64
+READY_TIMEOUT_S = 300
+# Intervalle de vérification des workers par le collecteur de résultats
+HEALTH_CHECK_S = 1.0
+
+
+def available_cores():
+    """Cœurs utilisables par ce processus (respecte l'affinité / les cgroups sous Linux)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(cores, replicas):
+    """Groupes de cœurs contigus, un par réplique"""
+    replicas = max(1, min(replicas, len(cores)))
+    return [list(map(int, group)) for group in np.array_split(np.array(cores), replicas)]
+
+
+def _attach(name):
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        # Le segment appartient au parent : le worker ne doit pas le détruire à sa sortie
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment
+
+
+def _gather(futures):
+    """Future résolu avec la concaténation des résultats de `futures`, dans l'ordre"""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def _done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        error = next((f.exception() for f in futures if f.exception() is not None), None)
+        if error is not None:
+            combined.set_exception(error)
+        else:
+            combined.set_result([entry for f in futures for entry in f.result()])
+
+    for future in futures:
+        future.add_done_callback(_done)
+    return combined
+
+
+# ---------------------------------------
+# 👷 PROCESSUS WORKER
+# ---------------------------------------
+def _worker_main(index, weights, cores, tasks, results):
+    threads = len(cores)
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    import torch
+    from inference import load_yolo, warmup
+    from result_cache import entry_from_result
+
+    torch.set_num_threads(threads)
+    try:
+        model = load_yolo(weights)
+        if model is None:
+            raise FileNotFoundError(weights)
+        warmup(model)
+    except Exception as e:
+        results.put(("failed", index, repr(e)))
+        return
+    # Les classes remontent avec le signal de disponibilité : le parent n'a pas à charger le modèle
+    results.put(("ready", index, dict(model.names)))
+
+    segments = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, specs, conf, imgsz = task
+        try:
+            images = []
+            for kind, payload, shape in specs:
+                if kind == "shm":
+                    segment = segments.get(payload) or segments.setdefault(payload, _attach(payload))
+                    images.append(np.ndarray(shape, dtype=np.uint8, buffer=segment.buf))
+                else:
+                    images.append(payload)
+            predictions = model.predict(images, conf=conf, imgsz=imgsz, verbose=False)
+            results.put((task_id, [entry_from_result(r) for r in predictions], None))
+        except Exception as e:
+            results.put((task_id, None, repr(e)))
+        finally:
+            images = None
+
+    for segment in segments.values():
+        segment.close()
+
+
+# ---------------------------------------
+# 🏭 POOL
+# ---------------------------------------
+class InferencePool:
+    """Pool de répliques du modèle dans des processus séparés.
+
+    `submit_many` renvoie un Future résolu avec une liste d'entrées compactes
+    (boxes / classes / scores, voir result_cache). Une tâche = un lot traité par
+    un seul appel `predict` dans le premier worker libre. Si un worker meurt,
+    les Futures en attente échouent et le pool refuse les nouvelles tâches
+    (`alive` devient faux) : à l'appelant d'en recréer un.
+    """
+
+    def __init__(self, weights=MODEL_PATH, replicas=None, slot_mb=DEFAULT_SLOT_MB, slots=None):
+        cores = available_cores()
+        replicas = replicas or max(1, len(cores) // 4)
+        self.core_groups = split_cores(cores, replicas)
+        self.replicas = len(self.core_groups)
+        self.slot_bytes = int(slot_mb * 1024 * 1024)
+
+        ctx = get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._slots = [
+            shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+            for _ in range(slots or self.replicas * 2 * DEFAULT_BATCH_SIZE)
+        ]
+        self._free = queue.Queue()
+        for slot in self._slots:
+            self._free.put(slot)
+        self._acquire_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._closed = False
+        self._failure = None
+        self.names = None
+
+        self._processes = [
+            ctx.Process(target=_worker_main, args=(i, weights, group, self._tasks, self._results),
+                        name=f"inference-worker-{i}", daemon=True)
+            for i, group in enumerate(self.core_groups)
+        ]
+        for process in self._processes:
+            process.start()
+        self._wait_ready()
+
+        self._collector = threading.Thread(target=self._collect, name="inference-pool-results", daemon=True)
+        self._collector.start()
+
+    def _wait_ready(self):
+        for _ in self._processes:
+            try:
+                status, index, payload = self._results.get(timeout=READY_TIMEOUT_S)
+            except queue.Empty:
+                # Processus et segments partagés libérés avant de remonter l'erreur
+                self.close()
+                raise
+            if status != "ready":
+                self.close()
+                raise RuntimeError(f"Worker {index} n'a pas pu charger le modèle : {payload}")
+            # Message "ready" : classes du modèle ({id: nom})
+            self.names = payload
+
+    # ---------------------------------------
+    # 📨 SOUMISSION
+    # ---------------------------------------
+    @property
+    def alive(self):
+        return not self._closed and self._failure is None
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("Pool d'inférence fermé")
+        if self._failure is not None:
+            raise RuntimeError(f"Pool d'inférence hors service : {self._failure}")
+
+    def submit_many(self, images, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ):
+        """Soumet un lot; au-delà du nombre d'emplacements partagés, il est découpé
+        en plusieurs tâches dont les résultats sont réunis dans l'ordre."""
+        self._check_open()
+        if not images:
+            future = Future()
+            future.set_result([])
+            return future
+        images = [np.ascontiguousarray(image, dtype=np.uint8) for image in images]
+        limit = len(self._slots)
+        if sum(image.nbytes <= self.slot_bytes for image in images) <= limit:
+            return self._submit(images, conf, imgsz)
+        chunks, current, used = [], [], 0
+        for image in images:
+            shared = image.nbytes <= self.slot_bytes
+            if shared and used == limit:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(image)
+            used += shared
+        chunks.append(current)
+        return _gather([self._submit(chunk, conf, imgsz) for chunk in chunks])
+
+    def _submit(self, images, conf, imgsz):
+        shared = [image for image in images if image.nbytes <= self.slot_bytes]
+
+        # Réservation de tous les emplacements du lot d'un coup (pas d'interblocage partiel)
+        with self._acquire_lock:
+            slots = [self._free.get() for _ in shared]
+
+        specs, free_slots = [], iter(slots)
+        for image in images:
+            if image.nbytes <= self.slot_bytes:
+                slot = next(free_slots)
+                np.ndarray(image.shape, dtype=np.uint8, buffer=slot.buf)[...] = image
+                specs.append(("shm", slot.name, image.shape))
+            else:
+                specs.append(("inline", image, image.shape))
+
+        future = Future()
+        task_id = next(self._ids)
+        with self._pending_lock:
+            if self._failure is not None or self._closed:
+                for slot in slots:
+                    self._free.put(slot)
+                self._check_open()
+            self._pending[task_id] = (future, slots)
+        self._tasks.put((task_id, specs, conf, imgsz))
+        return future
+
+    def predict(self, image, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ):
+        return self.submit_many([image], conf, imgsz).result()[0]
+
+    def map(self, images, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ, batch_size=DEFAULT_BATCH_SIZE):
+        """Répartit les images en lots sur toutes les répliques; résultats dans l'ordre"""
+        images = list(images)
+        futures = [
+            self.submit_many(images[i:i + batch_size], conf, imgsz)
+            for i in range(0, len(images), max(1, batch_size))
+        ]
+        return [entry for future in futures for entry in future.result()]
+
+    def _collect(self):
+        next_check = time.monotonic() + HEALTH_CHECK_S
+        try:
+            while True:
+                try:
+                    message = self._results.get(timeout=HEALTH_CHECK_S)
+                except queue.Empty:
+                    message = ()
+                # Vérification périodique, même quand les autres répliques répondent sans arrêt
+                now = time.monotonic()
+                if now >= next_check:
+                    next_check = now + HEALTH_CHECK_S
+                    dead = [p.name for p in self._processes if not p.is_alive()]
+                    if dead and not self._closed:
+                        self._fail(f"worker(s) arrêté(s) : {', '.join(dead)}")
+                        return
+                if message is None:
+                    return
+                if not message:
+                    continue
+                task_id, entries, error = message
+                with self._pending_lock:
+                    future, slots = self._pending.pop(task_id, (None, []))
+                for slot in slots:
+                    self._free.put(slot)
+                if future is None:
+                    continue
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(entries)
+        except Exception as e:
+            self._fail(f"collecteur de résultats : {e!r}")
+
+    def _fail(self, reason):
+        """Marque le pool hors service et fait échouer toutes les tâches en attente"""
+        with self._pending_lock:
+            self._failure = reason
+            pending, self._pending = self._pending, {}
+        for future, slots in pending.values():
+            for slot in slots:
+                self._free.put(slot)
+            if not future.done():
+                future.set_exception(RuntimeError(f"Pool d'inférence hors service : {reason}"))
+
+    def close(self):
+        with self._pending_lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        collector = getattr(self, "_collector", None)
+        if collector is not None:
+            collector.join(timeout=10)
+        # Tâches jamais terminées (worker bloqué) : leurs appelants ne doivent pas attendre
+        self._fail("pool fermé")
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()